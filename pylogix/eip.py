@@ -19,25 +19,33 @@
 
 import math
 import re
+import sys
 import time
 
 from .lgx_comm import Connection
 from .lgx_device import Device
+from .lgx_index import LeafTable, find_field, is_string, string_layout
 from .lgx_response import Response
-from .lgx_tag import Tag, UDT
+from .lgx_stream import Stream
+from .lgx_subscribe import Scheduler
+from .lgx_tag import Tag, TagTable, UDT, cip_data_types
 from .utils import is_micropython
 from random import randrange
-from struct import pack, unpack_from
+from struct import pack, pack_into, unpack_from
 
 
 if not is_micropython():
     from datetime import datetime, timedelta
 
+# templates retrieved in this process, see PLC._template_key
+template_cache = {}
+
 # noinspection PyMethodMayBeStatic
 class PLC(object):
     __slots__ = ('IPAddress', 'Port', 'ProcessorSlot', 'SocketTimeout', 'Micro800', 'Route', 'conn', 'Offset', 'UDT',
-                 'UDTByName', 'KnownTags', 'TagList', 'ProgramNames', 'StringID', 'StringEncoding', 'CIPTypes', "callback",
-                 'element_count', 'msg_values', 'msg_bytes')
+                 'UDTByName', 'UDTErrors', 'KnownTags', 'TagList', 'ProgramNames', 'StringID', 'StringEncoding', 'CIPTypes', "callback",
+                 'element_count', 'msg_values', 'msg_bytes', 'PipelineDepth',
+                 '_change_counters', '_struct_handles', '_scheduler')
 
     def __init__(self, ip_address="", slot=0, timeout=5.0, Micro800=False, port=44818):
         """
@@ -58,34 +66,17 @@ class PLC(object):
         self.Offset = 0
         self.UDT = {}
         self.UDTByName = {}
+        self.UDTErrors = {}
         self.KnownTags = {}
         self.TagList = []
         self.ProgramNames = []
         self.StringID = 0x0fce
         self.StringEncoding = 'utf-8'
-        self.CIPTypes = {0x00: (1, "UNKNOWN", '<B'),
-                         0xa0: (88, "STRUCT", '<B'),
-                         0xc0: (8, "DT", '<Q'),
-                         0xc1: (1, "BOOL", '<?'),
-                         0xc2: (1, "SINT", '<b'),
-                         0xc3: (2, "INT", '<h'),
-                         0xc4: (4, "DINT", '<i'),
-                         0xc5: (8, "LINT", '<q'),
-                         0xc6: (1, "USINT", '<B'),
-                         0xc7: (2, "UINT", '<H'),
-                         0xc8: (4, "UDINT", '<I'),
-                         0xc9: (8, "LWORD", '<Q'),
-                         0xca: (4, "REAL", '<f'),
-                         0xcc: (8, "LDT", '<Q'),
-                         0xcb: (8, "LREAL", '<d'),
-                         0xd0: (1, "O_STRING", '<B'),
-                         0xd1: (1, "BYTE", "<B"),
-                         0xd2: (2, "WORD", "<I"),
-                         0xd3: (4, "DWORD", '<i'),
-                         0xd6: (4, "TIME32", '<I'),
-                         0xd7: (8, "TIME", '<Q'),
-                         0xda: (1, "STRING", '<B'),
-                         0xdf: (8, "LTIME", '<Q')}
+        self.CIPTypes = dict(cip_data_types)
+        self.PipelineDepth = 1
+        self._change_counters = None
+        self._struct_handles = {}
+        self._scheduler = None
 
     @property
     def ConnectionSize(self):
@@ -106,7 +97,7 @@ class PLC(object):
         """
         Clean up on exit
         """
-        self.conn.close()
+        self.Close()
 
     def Read(self, tag, count=1, datatype=None):
         """
@@ -131,18 +122,23 @@ class PLC(object):
         else:
             return self._read_tag(tag, count, datatype)
 
-    def Write(self, tag, value=None, datatype=None):
+    def Write(self, tag, value=None, datatype=None, coalesce=False):
         """
         We have two options for writing depending on
         the arguments, write a single tag, or write an array
 
+        A list of tags is written in the order of the list.  With
+        coalesce=True, the writes may be reordered to fill the packets,
+        bits of the same word are combined and only the last value of
+        a tag in the list more than once is written
+
         returns Response class (.TagName, .Value, .Status)
         """
         if isinstance(tag, (list, tuple)):
             if len(tag) == 1:
                 return [self._write_tag(*tag[0])]
             else:
-                return self._batch_write(tag)
+                return self._batch_write(tag, coalesce)
         else:
             if value is None:
                 raise TypeError('You must provide a value to write')
@@ -176,12 +172,155 @@ class PLC(object):
         """
         self.UDT = {}
         self.KnownTags = {}
+        self._struct_handles = {}
         self.TagList = []
         self.ProgramNames = []
         tag_list = self._get_tag_list(allTags)
         updated_list = self._get_udt(tag_list.Value) if tag_list.Value else None
         return Response(None, updated_list, tag_list.Status)
 
+    def RefreshTagList(self, allTags=True):
+        """
+        Retrieves the tag list from the PLC only if the project
+        changed since the last RefreshTagList, which is checked with
+        the controller change counters.  Otherwise, TagList is returned
+        as is.  Controllers that don't have the change counters always
+        retrieve the tag list.  The counters are controller wide, there
+        is no counter per program, so a change retrieves every program
+        again, the UDT definitions that didn't change come from the
+        template cache.
+        Optional parameter allTags set to True
+        If is set to False, it will return only controller
+        otherwise controller tags and program tags.
+
+        returns Response class (.TagName, .Value, .Status)
+        """
+        conn = self.conn.connect()
+        if not conn[0]:
+            return Response(None, None, conn[1])
+
+        # read before the upload, so changes made during it are caught next time
+        counters = self._get_change_counters()
+        if counters is not None and self.TagList and self._change_counters == (allTags, counters):
+            return Response(None, self.TagList, 0)
+
+        tag_list = self.GetTagList(allTags)
+        if tag_list.Value is not None and counters is not None:
+            self._change_counters = (allTags, counters)
+        else:
+            self._change_counters = None
+        return tag_list
+
+    def GetTagTable(self, allTags=True):
+        """
+        Retrieves the tag list from the PLC as a TagTable, which
+        keeps the tag properties in parallel arrays rather than
+        creating a Tag for each tag.  Useful for very large tag lists.
+        Optional parameter allTags set to True
+        If is set to False, it will return only controller
+        otherwise controller tags and program tags.
+
+        returns Response class (.TagName, .Value, .Status)
+        """
+        conn = self.conn.connect()
+        if not conn[0]:
+            return Response(None, None, conn[1])
+
+        self.UDT = {}
+        self.UDTByName = {}
+        self.UDTErrors = {}
+        self.ProgramNames = []
+        table = TagTable()
+        table.UDT = self.UDT
+
+        status = 0
+        for status, page in self._tag_list_pages(None, table):
+            if page is None:
+                return Response(None, None, status)
+
+        if allTags and self.ProgramNames:
+            status, program_table = self._get_program_tag_lists(self.ProgramNames, True)
+            if program_table is None:
+                return Response(None, None, status)
+            table.extend(program_table)
+
+        # request the templates with one tag of each struct type
+        seen = set()
+        struct_tags = []
+        for i, val in enumerate(table.TypeValues):
+            if val & 0x8000 and val & 0xfff not in seen:
+                seen.add(val & 0xfff)
+                struct_tags.append(table[i])
+        self._get_templates(struct_tags)
+
+        return Response(None, table, status)
+
+    def ExpandTags(self, tags=None):
+        """
+        Expands the tags into every leaf path, ex: Line1.Conv[3].Speed,
+        with its data type, byte offset within the root tag, the bit of
+        BOOL members and the array dimensions.
+        Optional parameter tags, a tag list or TagTable to expand, by
+        default TagList is used, GetTagList is called if it is empty.
+        Tags only keep the first array dimension, use a TagTable for
+        multi-dimension struct arrays.
+
+        returns Response class (.TagName, .Value, .Status)
+        """
+        status = 0
+        if tags is None:
+            if not self.TagList:
+                ret = self.GetTagList()
+                if not ret.Value:
+                    return Response(None, None, ret.Status)
+                status = ret.Status
+            tags = self.TagList
+
+        leaves = LeafTable(self.UDT)
+        if isinstance(tags, TagTable):
+            for i in range(len(tags)):
+                leaves.add(tags[i], tags.Dims[i * 3:i * 3 + 3])
+        else:
+            for tag in tags:
+                leaves.add(tag)
+
+        return Response(None, leaves, status)
+
+    def IterTagList(self, programs=True, resolve_udts=True):
+        """
+        Retrieves the tag list from the PLC, yielding each tag as
+        soon as the packet containing it arrives, instead of building
+        the whole list first.
+        Optional parameter programs set to True will also yield the
+        program tags, False only controller tags, or provide a list of
+        program names to only yield the tags of those programs.
+        Optional parameter resolve_udts set to True will look up the
+        UDT name of struct tags on demand, templates are cached in UDT
+
+        Tags are not saved to TagList.  Raises IOError when a tag list
+        request fails, since the tags already yielded can't be taken back.
+
+        yields Tag class
+        """
+        conn = self.conn.connect()
+        if not conn[0]:
+            raise IOError(Response.get_error_code(conn[1]))
+
+        self.ProgramNames = []
+        for tag in self._iter_tag_list(None, resolve_udts):
+            yield tag
+
+        if programs is True:
+            program_names = list(self.ProgramNames)
+        elif programs:
+            program_names = programs
+        else:
+            program_names = []
+
+        for program_name in program_names:
+            for tag in self._iter_tag_list(program_name, resolve_udts):
+                yield tag
+
     def GetProgramTagList(self, programName):
         """
         Retrieves a program tag list from the PLC
@@ -193,9 +332,9 @@ class PLC(object):
         if not conn[0]:
             return Response(programName, None, conn[1])
 
-        # If ProgramNames is empty then _getTagList hasn't been called
+        # If ProgramNames is empty then the programs haven't been retrieved
         if not self.ProgramNames:
-            self._get_tag_list(False)
+            self._get_program_names()
 
         # Get single program tags if programName exists
         if programName in self.ProgramNames:
@@ -212,7 +351,7 @@ class PLC(object):
         """
         Retrieves a program names list from the PLC
         Sanity check: checks if programNames is empty
-        and runs _getTagList
+        and retrieves the programs, without the controller tags
 
         returns Response class (.TagName, .Value, .Status)
         """
@@ -221,11 +360,8 @@ class PLC(object):
         if not conn[0]:
             return Response(None, None, conn[1])
 
-        tags = ''
         if not self.ProgramNames:
-            tags = self._get_tag_list(False)
-        if tags:
-            status = tags.Status
+            self._get_program_names()
         if self.ProgramNames:
             status = 0
         else:
@@ -279,10 +415,86 @@ class PLC(object):
         self.callback = callback
         return self._receive_message(ip_address, port)
 
+    def Subscribe(self, tags, rate_ms, callback, deadband=None):
+        """
+        Read the tags every rate_ms milliseconds in the background.
+        callback is called with the Response of each tag when its value
+        or status changes, numeric values only when they move more than
+        the optional deadband.  Subscriptions with the same rate are
+        read together, tags in more than one are read once.
+
+        returns Subscription, call .Cancel() to stop it
+        """
+        if self._scheduler is None:
+            self._scheduler = Scheduler(self)
+        subscription = self._scheduler.Subscribe(tags, rate_ms, callback, deadband)
+        self._scheduler.Start()
+        return subscription
+
+    def Sample(self, tags, rate_ms, callback):
+        """
+        Read the tags every rate_ms milliseconds in the background,
+        on multiples of the rate on the clock (every 100ms on the tick).
+        callback is called with the sample timestamp and the Response
+        of every tag each sample.  Samples that would be late because
+        the previous one took too long are skipped, the timing of each
+        rate is kept in Scheduler.Stats()
+
+        returns Sampler, call .Cancel() to stop it
+        """
+        if self._scheduler is None:
+            self._scheduler = Scheduler(self)
+        sampler = self._scheduler.Sample(tags, rate_ms, callback)
+        self._scheduler.Start()
+        return sampler
+
+    def Stream(self, tags, interval, max_size=100, overflow='oldest'):
+        """
+        Sample the tags every interval (seconds), iterate the returned
+        Stream (for or async for) to get (timestamp, [Response...]) for
+        each sample.  Up to max_size samples are queued for a slow consumer,
+        then the oldest are dropped, or with overflow='newest', the new ones.
+        With overflow='block', sampling waits for the consumer, in a thread
+        of its own.
+
+        returns Stream, call .Close() to stop it
+        """
+        return Stream(self, tags, interval, max_size, overflow)
+
+    def ReadChunks(self, tag, count, chunk=None):
+        """
+        Read count elements of an array, yields a Response of each chunk
+        of elements as the reply fragments arrive, rather than reading the
+        whole array first.  The TagName of each Response is the first
+        element of the chunk.  chunk is the number of elements per chunk,
+        by default each chunk is the elements of a reply fragment.
+
+        Structures (other than strings) are bytes, BOOL arrays and
+        Micro800 strings aren't supported
+        """
+        if chunk is not None and chunk < 1:
+            raise ValueError('chunk must be at least 1, not {}'.format(chunk))
+        return self._read_chunks(tag, count, chunk)
+
+    def ReadInto(self, tag, buffer, count=None):
+        """
+        Read the elements of an array into a writable buffer (bytearray,
+        array.array, numpy array...) as the reply fragments arrive.
+        Typed buffers must have the size of an element (array('f') for
+        a REAL), the data is copied as it comes from the PLC (little
+        endian).  count is the size of the buffer by default.
+
+        returns Response with the number of elements read as Value
+        """
+        return self._read_into(tag, buffer, count)
+
     def Close(self):
         """
         Close the connection to the PLC
         """
+        if self._scheduler is not None:
+            self._scheduler.Stop()
+            self._scheduler = None
         return self.conn.close()
 
     def _read_tag(self, tag_name, elements=1, data_type=None):
@@ -376,6 +588,183 @@ class PLC(object):
 
         return Response(tag_name, value, status)
 
+    def _read_chunks(self, tag_name, elements, chunk):
+        """
+        Decode the fragments of an array read as they arrive
+        """
+        status, element_size = self._array_element_size(tag_name)
+        if status != 0:
+            yield Response(tag_name, None, status)
+            return
+
+        tag, base_tag, index = parse_tag_name(tag_name)
+        start = 0
+        values = []
+        pending = b''
+        for status, data in self._read_fragments(tag_name, elements):
+            if data is None:
+                if values:
+                    yield Response(self._element_name(tag_name, start), values, 0)
+                yield Response(self._element_name(tag_name, start + len(values)), None, status)
+                return
+
+            # an element can be split between two fragments
+            data = pending + data
+            whole = len(data) - len(data) % element_size
+            pending = data[whole:]
+            values.extend(self._decode_elements(base_tag, data[:whole], element_size))
+            while values and (chunk is None or len(values) >= chunk):
+                size = len(values) if chunk is None else chunk
+                yield Response(self._element_name(tag_name, start), values[:size], 0)
+                values = values[size:]
+                start += size
+
+        if values:
+            yield Response(self._element_name(tag_name, start), values, 0)
+
+    def _read_into(self, tag_name, buffer, elements):
+        """
+        Copy the fragments of an array read into the buffer
+        """
+        status, element_size = self._array_element_size(tag_name)
+        if status != 0:
+            return Response(tag_name, None, status)
+
+        try:
+            view = memoryview(buffer)
+        except TypeError:
+            # python 2, array.array has no memoryview
+            view = None
+        if view is not None and getattr(view, 'readonly', False):
+            raise TypeError('ReadInto needs a writable buffer, {} is read-only'.format(type(buffer).__name__))
+
+        item_size = getattr(view, 'itemsize', 1) if view is not None else buffer.itemsize
+        if item_size != 1:
+            if item_size != element_size:
+                return Response(tag_name, None, 'Buffer item size does not match the data type')
+            # python 2 has no cast, the elements are decoded into the buffer
+            view = view.cast('B') if hasattr(view, 'cast') else None
+        size = len(view) if view is not None else len(buffer) * item_size
+        if elements is None:
+            elements = size // element_size
+        if elements * element_size > size:
+            return Response(tag_name, None, 'Buffer is too small')
+
+        tag, base_tag, index = parse_tag_name(tag_name)
+        position = 0
+        pending = b''
+        for status, data in self._read_fragments(tag_name, elements):
+            if data is None:
+                return Response(tag_name, position // element_size, status)
+            data = data[:size - position]
+            if view is not None:
+                view[position:position + len(data)] = data
+                position += len(data)
+                continue
+
+            # an element can be split between two fragments
+            data = pending + data
+            whole = len(data) - len(data) % element_size
+            pending = data[whole:]
+            values = self._decode_elements(base_tag, data[:whole], element_size)
+            first = position // element_size
+            try:
+                buffer[first:first + len(values)] = values
+            except TypeError:
+                buffer[first:first + len(values)] = type(buffer)(buffer.typecode, values)
+            position += whole
+
+        return Response(tag_name, position // element_size, 0)
+
+    def _array_element_size(self, tag_name):
+        """
+        Status and size of an element of the array, for the chunked
+        reads, which need elements of a fixed size
+        """
+        conn = self.conn.connect()
+        if not conn[0]:
+            return conn[1], None
+
+        tag, base_tag, index = parse_tag_name(tag_name)
+        resp = self._initial_read(tag, base_tag, None)
+        if resp[2] != 0 and resp[2] != 6:
+            return resp[2], None
+
+        data_type, data_len = self.KnownTags[base_tag]
+        if data_type == 0xd3 or bit_of_word(tag):
+            return 'BOOL arrays are not supported', None
+        if data_type in (0xd0, 0xda):
+            return 'Strings of variable length are not supported', None
+        if data_type == 0xa0:
+            handle = self._struct_handles.get(base_tag)
+            layout = self._string_layout(handle)
+            if layout is not None:
+                return 0, layout[3]
+            udt = self._udt_by_handle(handle)
+            return 0, udt.Size if udt is not None else data_len
+        return 0, self.CIPTypes[data_type][0]
+
+    def _read_fragments(self, tag_name, elements):
+        """
+        Send the requests of an array read, yields the status and the
+        data of each reply fragment, without the data type.  The data
+        is None when the read failed
+        """
+        tag, base_tag, index = parse_tag_name(tag_name)
+        data_type = self.KnownTags[base_tag][0]
+        pad = 4 if data_type == 0xa0 else 2
+        if isinstance(index, list) and elements > 0xffff:
+            # the start of each request is an element name, which
+            # would need the dimensions of a multi-dimensional array
+            yield 'Multi-dimensional arrays are limited to 65535 elements', None
+            return
+
+        done = 0
+        while done < elements:
+            # requests are limited to 0xffff elements
+            count = min(elements - done, 0xffff)
+            name = self._element_name(tag_name, done)
+            ioi = self._build_ioi(name, data_type)
+            self.Offset = 0
+            status, ret_data = self.conn.send(self._add_read_service(ioi, count))
+            while True:
+                if status not in (0, 6) or not ret_data:
+                    yield status, None
+                    return
+                data = ret_data[50 + pad:]
+                self.Offset += len(data)
+                yield status, data
+                if status == 0:
+                    break
+                status, ret_data = self.conn.send(self._add_partial_read_service(ioi, count))
+            done += count
+
+    def _decode_elements(self, base_tag, data, element_size):
+        """
+        Values of the whole elements in data
+        """
+        data_type = self.KnownTags[base_tag][0]
+        if data_type == 0xa0:
+            layout = self._string_layout(self._struct_handles.get(base_tag))
+            if layout is not None:
+                return self._unpack_strings(data, layout)
+            return [data[i:i + element_size] for i in range(0, len(data), element_size)]
+
+        fmt = self.CIPTypes[data_type][2][1:]
+        if fmt == '?' and is_micropython():
+            # no ? in the micropython struct module
+            return [value != 0 for value in unpack_from('<{}B'.format(len(data)), data)]
+        return list(unpack_from('<{}{}'.format(len(data) // element_size, fmt), data))
+
+    def _element_name(self, tag_name, offset):
+        """
+        Name of the element offset elements after the tag
+        """
+        tag, base_tag, index = parse_tag_name(tag_name)
+        if not offset or isinstance(index, list):
+            return tag_name
+        return '{}[{}]'.format(base_tag, index + offset)
+
     def _batch_read(self, tags):
         """
         Read tags using multi-service messaging
@@ -428,43 +817,32 @@ class PLC(object):
         """
         Read tags using multi-service messaging
         """
-        # generate a list of service requests
-        ret_services = self._generate_read_service_list(tags)
-
-        # format tags to match services
-        new_tags = []
-        count = 0
-        for s in (ret_services):
-            temp = []
-            for v in s:
-                temp.append(tags[count])
-                count += 1
-            new_tags.append(temp)
+        compiled = self._compile_read_requests(tags)
+        replies = self._send_requests([request for request, _ in compiled])
 
         response = []
-        for i, services in enumerate(ret_services):
-            header = self._build_multi_service_header()
-            tag_count = pack("<H", len(new_tags[i]))
-            # # calculate the offsets
-            current_offset = len(new_tags[i]) * 2 + 2
-            offsets = pack("<H", current_offset)
-            for j in range(len(services)-1):
-                current_offset += len(services[j])
-                offsets += pack("<H", current_offset)
-
-            segments = b''.join(s for s in services)
-            request = header + tag_count + offsets + segments
-
-            status, ret_data = self.conn.send(request)
-
+        for (request, request_tags), (status, ret_data) in zip(compiled, replies):
             # return error if no data is returned
             if not ret_data:
-                return [[t, None, status] for t in new_tags[i]]
-
-            response.extend(self._parse_multi_read_response(ret_data, new_tags[i]))
+                response.extend([t[0], None, status] for t in request_tags)
+            else:
+                response.extend(self._parse_multi_read_response(ret_data, request_tags))
 
         return response
 
+    def _compile_read_requests(self, tags):
+        """
+        Pack the read services of the tags into multiple service
+        requests.  Returns a list of (request, tags) for each request
+        """
+        compiled = []
+        count = 0
+        for services in self._generate_read_service_list(tags):
+            compiled.append((self._build_multi_service(services), tags[count:count + len(services)]))
+            count += len(services)
+
+        return compiled
+
     def _generate_read_service_list(self, tags):
         """
         Generate a list of read services for the multi-message service.
@@ -528,7 +906,7 @@ class PLC(object):
 
         return accumulated
 
-    def _batch_write(self, tags):
+    def _batch_write(self, tags, coalesce=False):
         """
         Processes the multiple write request. Split into multiple requests and
         reassemble responses when needed
@@ -551,27 +929,67 @@ class PLC(object):
 
         self._get_unknown_types(new_tags)
 
+        services = self._generate_write_service_list(tags, coalesce)
+        statuses = [0] * len(tags)
+
+        # writes too large for a multi-service packet are written on their
+        # own, so they can be fragmented.  In order, the packets before one
+        # are sent first, coalesced, they are written after all the packets
+        groups = []
+        if coalesce:
+            groups.append((False, [s for s in services if s[1] is not None]))
+            groups.extend((True, s) for s in services if s[1] is None)
+        else:
+            for service in services:
+                if service[1] is None:
+                    groups.append((True, service))
+                elif groups and not groups[-1][0]:
+                    groups[-1][1].append(service)
+                else:
+                    groups.append((False, [service]))
+
+        for single, group in groups:
+            if single:
+                for i in group[2]:
+                    statuses[i] = self._write_tag(*tags[i]).Status
+                continue
+
+            packets = self._pack_write_services(group, coalesce)
+            requests = [self._multi_write(packet) for packet in packets]
+            for packet, (status, ret_data) in zip(packets, self._send_requests(requests)):
+                for service, service_status in zip(packet, self._parse_multi_write(packet, status, ret_data)):
+                    self._set_write_status(statuses, service[2], service_status)
+
         result = []
-        while len(result) < len(tags):
-            if len(result) == len(tags) - 1:
-                # single tag left over, can't use multi msg service
-                tag = tags[len(result):][0]
-                result.append(self._write_tag(*tag))
-            else:
-                result.extend(self._multi_write(tags[len(result):]))
+        for i, t in enumerate(tags):
+            value = t[1]
+            if isinstance(value, (list, tuple)) and len(value) == 1:
+                value = value[0]
+            result.append(Response(t[0], value, statuses[i]))
 
         return result
 
+    def _set_write_status(self, statuses, indexes, status):
+        """
+        Keep the first failed status of each tag, a tag can
+        take more than one service (bools spanning words)
+        """
+        self._is_not_used()
+        for i in indexes:
+            if not statuses[i]:
+                statuses[i] = status
+
     def _write_tag(self, tag_name, value, data_type=None):
         """
         Processes the write request
         """
-        write_data = []
-
         conn = self.conn.connect()
         if not conn[0]:
             return Response(tag_name, None, conn[1])
 
+        if isinstance(value, dict):
+            return self._write_struct(tag_name, value)
+
         tag, base_tag, index = parse_tag_name(tag_name)
         resp = self._initial_read(tag, base_tag, data_type)
         if resp[2] != 0 and resp[2] != 6:
@@ -579,16 +997,41 @@ class PLC(object):
 
         data_type = self.KnownTags[base_tag][0]
 
-        # check if values passed were a list
-        if not isinstance(value, (list, tuple)):
-            value = [value]
-
-        # format the values
-        for v in value:
-            write_data.append(v)
+        # standard or custom length strings
+        struct_handle = self._struct_handles.get(base_tag, self.StringID)
+        layout = self._string_layout(struct_handle) if data_type == 0xa0 else None
+        if layout is None:
+            struct_handle = None
+
+        # buffers are written as is, everything else is a list of values
+        write_data = self._write_buffer(tag_name, value, data_type)
+        if write_data is not None:
+            element_size = self.CIPTypes[data_type][0]
+            element_count = len(write_data) // element_size
+        elif layout is not None:
+            # strings are packed up front, standard or custom length
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            write_data = self._pack_strings(value, layout)
+            element_size = layout[3]
+            element_count = len(value)
+        else:
+            element_size = 1
+            # check if values passed were a list
+            if isinstance(value, (list, tuple)):
+                write_data = list(value)
+            elif hasattr(value, 'tolist'):
+                # numpy arrays that aren't a buffer of our type, or scalars
+                write_data = value.tolist()
+                if not isinstance(write_data, list):
+                    write_data = [write_data]
+                value = write_data
+            else:
+                value = [value]
+                write_data = list(value)
 
-        # save the number of values we are writing
-        element_count = len(write_data)
+            # save the number of values we are writing
+            element_count = len(write_data)
 
         # iterations will normally be 1, with the exception
         # of array reads larger than 0xffff elements
@@ -596,6 +1039,7 @@ class PLC(object):
         if iterations < 1:
             iterations = 1
 
+        requests = []
         for i in range(iterations):
             # convert writeData to packet sized lists
             self.Offset = 0
@@ -610,64 +1054,284 @@ class PLC(object):
 
                 element_count -= 0xffff
                 ioi = self._build_ioi(new_tag, data_type)
-                values = write_data[new_index:new_index+count]
+                start = i * 0xffff * element_size
+                values = write_data[start:start + count * element_size]
             else:
                 count = element_count
                 ioi = self._build_ioi(tag_name, data_type)
                 values = write_data
 
-            values = self._convert_write_data(base_tag, data_type, values)
+            values = self._convert_write_data(base_tag, data_type, values, element_size if layout else None)
 
-            # handle sending write data
+            # build the requests for the write data
             if len(values) > 1:
                 # write requires multiple packets
                 for w in values:
-                    request = self._add_frag_write_service(count, ioi, w, data_type)
-                    status, ret_data = self.conn.send(request)
-                    self.Offset += len(w) * self.CIPTypes[data_type][0]
+                    requests.append(self._add_frag_write_service(count, ioi, w, data_type, struct_handle))
+                    if isinstance(w, bytes):
+                        self.Offset += len(w)
+                    else:
+                        self.Offset += len(w) * self.CIPTypes[data_type][0]
             else:
                 # write fits in one packet
                 if bit_of_word(tag_name) or data_type == 0xd3:
                     byte_count = self.CIPTypes[data_type][0] * 8
                     high, low, tags = mod_write_masks(tag_name, values[0], byte_count)
-                    for i in range(len(high)):
-                        ioi = self._build_ioi(tags[i], data_type)
-                        request = self._add_mod_write_service(ioi, data_type, high[i], low[i])
-                        status, ret_data = self.conn.send(request)
+                    for j in range(len(high)):
+                        ioi = self._build_ioi(tags[j], data_type)
+                        requests.append(self._add_mod_write_service(ioi, data_type, high[j], low[j]))
                 else:
-                    request = self._add_write_service(ioi, values[0], data_type)
+                    requests.append(self._add_write_service(ioi, values[0], data_type, struct_handle, count))
 
-                    status, ret_data = self.conn.send(request)
+        if len(requests) == 1:
+            status, ret_data = self.conn.send(requests[0])
+        else:
+            # large writes, stream the requests back to back
+            status = self._send_write_requests(requests)
 
-        if len(value) == 1:
+        if isinstance(value, (list, tuple)) and len(value) == 1:
             value = value[0]
 
         return Response(tag_name, value, status)
 
-    def _multi_write(self, write_data):
+    def _write_struct(self, tag_name, value):
+        """
+        Write a dict of member names and values to a UDT as one
+        structure write.  The structure is read first, members that
+        aren't in the dict keep the value read from the PLC
+        """
+        ioi = self._build_ioi(tag_name, 0xa0)
+        status, handle, image = self._read_struct(ioi)
+        if status != 0:
+            return Response(tag_name, value, status)
+
+        udt = self._udt_by_handle(handle)
+        if udt is None:
+            # the templates come with the tag list, uploading it here would
+            # take long on a large project, so the caller loads it first
+            return Response(tag_name, value, 'Unknown UDT, call GetTagList first')
+
+        try:
+            self._encode_struct(udt, value, image, 0)
+        except Exception as e:
+            return Response(tag_name, value, str(e))
+
+        # payload space of each packet, on a 4 byte boundary
+        space = self.ConnectionSize - 110 - len(ioi)
+        space -= space % 4
+        image = bytes(image)
+        if len(image) <= space:
+            status, ret_data = self.conn.send(self._add_write_service(ioi, image, 0xa0, handle, 1))
+        else:
+            requests = []
+            for offset in range(0, len(image), space):
+                self.Offset = offset
+                chunk = image[offset:offset + space]
+                requests.append(self._add_frag_write_service(1, ioi, chunk, 0xa0, handle))
+            status = self._send_write_requests(requests)
+
+        return Response(tag_name, value, status)
+
+    def _read_struct(self, ioi):
         """
-        Processes the multiple write request
+        Read the raw image of a structure.  Returns the status,
+        the structure handle and the image as a bytearray
         """
-        service_segments = []
-        segments = b""
-        tag_count = 0
         self.Offset = 0
+        status, ret_data = self.conn.send(self._add_read_service(ioi, 1))
+        if status not in (0, 6) or not ret_data:
+            return status, None, None
 
-        min_tag_size = 24
-        service_segment_size = 8
+        data_type, _, handle = unpack_from('<BBH', ret_data, 50)
+        if data_type != 0xa0:
+            return 'Tag is not a UDT, please check tag name!', None, None
 
-        header = self._build_multi_service_header()
+        image = bytearray(ret_data[54:])
+        while status == 6:
+            self.Offset = len(image)
+            status, ret_data = self.conn.send(self._add_partial_read_service(ioi, 1))
+            if status not in (0, 6) or not ret_data:
+                return status, None, None
+            image += ret_data[54:]
+        return status, handle, image
+
+    def _udt_by_handle(self, handle):
+        """
+        Find the UDT of a structure handle, in UDT or in the templates
+        cached for this controller.  Strings are excluded since they
+        are written as strings
+        """
+        for udt in self.UDT.values():
+            if udt.Handle == handle and not is_string(udt):
+                return udt
+
+        controller = self._template_key(None, None)[:4]
+        for key, udt in template_cache.items():
+            if key[:4] == controller and key[5] == handle and not is_string(udt):
+                return udt
+        return None
+
+    def _udt_by_instance(self, instance):
+        """
+        Find the UDT of a template instance, in UDT or in
+        the templates cached for this controller
+        """
+        if instance in self.UDT:
+            return self.UDT[instance]
+
+        controller = self._template_key(None, None)[:4]
+        for key, udt in template_cache.items():
+            if key[:4] == controller and key[4] == instance:
+                return udt
+        return None
+
+    def _encode_struct(self, udt, values, image, offset):
+        """
+        Pack the dict values into the structure image at the offset,
+        nested UDT's take a dict (or list of dicts for arrays)
+        """
+        for name, value in values.items():
+            field = find_field(udt, name)
+            if field is None:
+                raise ValueError('{} is not a member of {}'.format(name, udt.Name))
+
+            # the member offset is a UDINT, split in two by the template parsing
+            member_offset = offset + field.Meta + (field.InstanceID << 16)
+            child = self._udt_by_instance(field.DataTypeValue) if field.Struct else None
+            items = value if field.Array and isinstance(value, (list, tuple)) else [value]
+            if field.Array and len(items) > max(field.Size, 1) * (32 if field.SymbolType == 0xd3 else 1):
+                raise ValueError('Too many values for {}'.format(name))
+
+            if field.Struct:
+                if child is None:
+                    raise ValueError('Unknown UDT for {}'.format(name))
+                for i, v in enumerate(items):
+                    if is_string(child):
+                        self._encode_string(child, v, image, member_offset + i * child.Size)
+                    elif isinstance(v, dict):
+                        self._encode_struct(child, v, image, member_offset + i * child.Size)
+                    else:
+                        raise TypeError('{} is a {}, values must be a dict'.format(name, child.Name))
+            elif field.SymbolType == 0xc1 and not field.Array:
+                # BOOL members are a bit of a hidden SINT
+                bit = unpack_from('<H', field.Bytes, 0)[0]
+                if value:
+                    image[member_offset] |= 1 << bit
+                else:
+                    image[member_offset] &= ~(1 << bit) & 0xff
+            elif field.SymbolType == 0xd3 and all(isinstance(v, bool) for v in items):
+                # BOOL arrays are stored in DWORDs
+                for i, v in enumerate(items):
+                    if v:
+                        image[member_offset + i // 8] |= 1 << (i % 8)
+                    else:
+                        image[member_offset + i // 8] &= ~(1 << (i % 8)) & 0xff
+            elif field.SymbolType in self.CIPTypes:
+                fmt = self.CIPTypes[field.SymbolType][2]
+                pack_into('<{}{}'.format(len(items), fmt[-1]), image, member_offset, *items)
+            else:
+                raise ValueError('Unable to write {}'.format(name))
+
+    def _encode_string(self, udt, value, image, offset):
+        """
+        Pack a string into a STRING (or custom string)
+        member of the structure image
+        """
+        length = find_field(udt, 'LEN')
+        data = find_field(udt, 'DATA')
+        encoded = value.encode(self.StringEncoding)[:data.Size]
+        data_offset = offset + data.Meta + (data.InstanceID << 16)
+        pack_into('<i', image, offset + length.Meta + (length.InstanceID << 16), len(encoded))
+        image[data_offset:data_offset + data.Size] = encoded + b'\x00' * (data.Size - len(encoded))
 
-        write_values = []
-        for wd in write_data:
+    def _send_write_requests(self, requests):
+        """
+        Send the fragments of a write one at a time, each only after
+        the previous one succeeded, so nothing is written past a
+        failed fragment.  Returns the status of the fragment that
+        failed, or 0
+        """
+        for request in requests:
+            status, ret_data = self.conn.send(request)
+            if status:
+                return status
+        return 0
+
+    def _multi_write(self, services):
+        """
+        Build the request for a packet of write services, a
+        single service is sent without the multi-service header
+        """
+        if len(services) == 1:
+            return services[0][0]
+        return self._build_multi_service([s[0] for s in services])
 
+    def _parse_multi_write(self, services, status, ret_data):
+        """
+        Get the status of each write service from the reply
+        """
+        self._is_not_used()
+        # return error if no data is returned
+        if not ret_data:
+            return [status] * len(services)
+        if len(services) == 1:
+            return [status]
+
+        segments = self._split_multi_service_reply(ret_data)
+        return [unpack_from('<B', segment, 2)[0] for segment in segments]
+
+    def _pack_write_services(self, services, reorder=False):
+        """
+        Pack the write services into packets in order, a packet is
+        filled until the next service doesn't fit.  With reorder, into
+        as few packets as possible, first fit decreasing: the largest
+        services are placed first, each in the first packet it fits in
+        """
+        packets = []
+        sizes = []
+        if not reorder:
+            for service in services:
+                if packets and sizes[-1] + service[1] + 2 < self.ConnectionSize:
+                    packets[-1].append(service)
+                    sizes[-1] += service[1] + 2
+                else:
+                    packets.append([service])
+                    sizes.append(30 + service[1] + 2)
+            return packets
+
+        for service in sorted(services, key=lambda x: x[1], reverse=True):
+            for i in range(len(packets)):
+                if sizes[i] + service[1] + 2 < self.ConnectionSize:
+                    packets[i].append(service)
+                    sizes[i] += service[1] + 2
+                    break
+            else:
+                packets.append([service])
+                sizes.append(30 + service[1] + 2)
+
+        return packets
+
+    def _generate_write_service_list(self, tags, coalesce=False):
+        """
+        Generate the write services for the multi-service message, in
+        the order of the tags.  Bit writes to the same word (bits of a
+        DINT, BOOL array words) that follow each other are merged into
+        a single read modify write.  With coalesce, bit writes to the
+        same word are merged wherever they are in the list, and repeated
+        writes to the same tag only write the last value.
+
+        Returns a list of [service, size, indexes], indexes are the
+        tags the service writes.  Size is None when the service
+        doesn't fit in a packet by itself
+        """
+        services = []
+        words = {}
+        writes = {}
+        for i, wd in enumerate(tags):
             tag_name, base_tag, index = parse_tag_name(wd[0])
 
             if base_tag in self.KnownTags.keys():
                 data_type = self.KnownTags[base_tag][0]
-                dt_size = self.CIPTypes[data_type][0]
-                if data_type == 0xa0:
-                    dt_size -= 8
             else:
                 if type(wd[1]) == str:
                     data_type = 0xa0
@@ -675,84 +1339,64 @@ class PLC(object):
                     data_type = 0xca
                 else:
                     data_type = 0x00
-                dt_size = self.CIPTypes[data_type][0]
 
-            typ = type(wd[1])
-            value = typ(wd[1])
+            if isinstance(wd[1], dict):
+                # UDT's are read before they are written
+                services.append([None, None, [i]])
+                continue
 
             # ensure that write values are always a list
-            if isinstance(value, (list, tuple)):
-                value = value
+            if isinstance(wd[1], (list, tuple)):
+                value = list(wd[1])
             else:
-                value = [value]
-
-            rsp_tag_size = min_tag_size + len(base_tag) + dt_size
+                value = [wd[1]]
 
             if bit_of_word(tag_name) or data_type == 0xd3:
                 # bool arrays are unique
-                byte_count = self.CIPTypes[data_type][0] * 8
-                high, low, tags = mod_write_masks(tag_name, value, byte_count)
-                temp_segments = []
-                tmp_count = tag_count
-                tmp_write_values = []
-                booleans_fit = True
-                for i in range(len(high)):
-                    ioi = self._build_ioi(tags[i], data_type)
-                    write_service = self._add_mod_write_service(ioi, data_type, high[i], low[i])
-
-                    next_request_size = service_segment_size + rsp_tag_size + 2
-                    # check if request size does not exceed (ConnectionSize bytes limit)
-                    if next_request_size <= self.ConnectionSize and rsp_tag_size <= self.ConnectionSize:
-                        service_segment_size = service_segment_size + rsp_tag_size
-                        temp_segments.append(write_service)
-                        tmp_write_values.append((tags[i], value))
-                        tag_count = tag_count + 1
+                bits = self.CIPTypes[data_type][0] * 8
+                high, low, word_tags = mod_write_masks(tag_name, value, bits)
+                for j in range(len(high)):
+                    ioi = self._build_ioi(word_tags[j], data_type)
+                    key = (ioi, data_type)
+                    if key in words and (coalesce or services[-1] is words[key]):
+                        word = words[key]
+                        word[3], word[4] = merge_write_masks(word[3], word[4], high[j], low[j], bits)
+                        word[0] = self._add_mod_write_service(ioi, data_type, word[3], word[4])
+                        if i not in word[2]:
+                            word[2].append(i)
                     else:
-                        # BOOLs didn't fit in the current packet, abort
-                        booleans_fit = True
-                        tag_count = tmp_count
-                        break
-                if booleans_fit:
-                    # if the booleans fit in this request, append them.
-                    write_values.extend(tmp_write_values)
-                    service_segments.extend(temp_segments)
+                        word = [self._add_mod_write_service(ioi, data_type, high[j], low[j]), 0, [i],
+                                high[j], low[j]]
+                        words[key] = word
+                        services.append(word)
             else:
                 ioi = self._build_ioi(tag_name, data_type)
-                write_service = self._add_write_service(ioi, value, data_type)
-                write_values.append((wd[0], value))
-                next_request_size = service_segment_size + rsp_tag_size + 2
-
-                # check if request size does not exceed (ConnectionSize bytes limit)
-                if next_request_size <= self.ConnectionSize and rsp_tag_size <= self.ConnectionSize:
-                    service_segment_size = service_segment_size + rsp_tag_size
-                    service_segments.append(write_service)
-                    tag_count = tag_count + 1
+                layout = None
+                if data_type == 0xa0:
+                    struct_handle = self._struct_handles.get(base_tag, self.StringID)
+                    layout = self._string_layout(struct_handle)
+                if layout is not None:
+                    write_data = self._pack_strings(value, layout)
+                    write_service = self._add_write_service(ioi, write_data, data_type, struct_handle, len(value))
                 else:
-                    break
-
-        segment_count = pack('<H', tag_count)
-
-        temp = len(header)
-        if tag_count > 2:
-            temp += (tag_count - 2) * 2
-        offsets = pack('<H', temp)
-
-        # assemble all the segments
-        for i in range(tag_count):
-            segments += service_segments[i]
-
-        for i in range(tag_count - 1):
-            temp += len(service_segments[i])
-            offsets += pack('<H', temp)
-
-        request = header + segment_count + offsets + segments
-        status, ret_data = self.conn.send(request)
+                    write_service = self._add_write_service(ioi, value, data_type)
+                key = (ioi, data_type, len(value))
+                if coalesce and key in writes:
+                    # packets can be sent in any order, the last value wins
+                    writes[key][0] = write_service
+                    writes[key][2].append(i)
+                else:
+                    writes[key] = [write_service, 0, [i]]
+                    services.append(writes[key])
 
-        # return error if no data is returned
-        if not ret_data:
-            return [Response(w[0], w[1], status) for w in write_data]
+        for service in services:
+            del service[3:]
+            if service[0] is not None and 30 + len(service[0]) + 2 < self.ConnectionSize:
+                service[1] = len(service[0])
+            else:
+                service[1] = None
 
-        return self._parse_multi_write(write_values, ret_data)
+        return services
 
     def _get_plc_time(self, raw=False):
         """
@@ -809,33 +1453,19 @@ class PLC(object):
         if not conn[0]:
             return Response(None, None, conn[1])
 
-        self.Offset = 0
-        status = 6
+        status = 0
         tags = []
 
-        while status == 6:
-            request = self._build_tag_list_request(program_name=None)
-            status, ret_data = self.conn.send(request)
-            if status == 0 or status == 6:
-                tags += self._parse_packet(ret_data, program_name=None)
-                self.Offset += 1
-            else:
+        for status, page in self._tag_list_pages(None):
+            if page is None:
                 return Response(None, None, status)
+            tags += page
 
-        if all_tags:
-            for program_name in self.ProgramNames:
-
-                self.Offset = 0
-                status = 6
-
-                while status == 6:
-                    self.Offset += 1
-                    request = self._build_tag_list_request(program_name)
-                    status, ret_data = self.conn.send(request)
-                    if status == 0 or status == 6:
-                        tags += self._parse_packet(ret_data, program_name)
-                    else:
-                        return Response(None, None, status)
+        if all_tags and self.ProgramNames:
+            status, program_tags = self._get_program_tag_lists(self.ProgramNames)
+            if program_tags is None:
+                return Response(None, None, status)
+            tags += program_tags
 
         self.TagList = tags
         return Response(None, tags, status)
@@ -848,58 +1478,236 @@ class PLC(object):
         if not conn[0]:
             return Response(None, None, conn[1])
 
-        self.Offset = 0
-        status = 6
+        status = 0
         tags = []
 
+        for status, page in self._tag_list_pages(program_name):
+            if page is None:
+                return Response(None, None, status)
+            tags += page
+
+        return Response(None, tags, status)
+
+    def _get_program_names(self):
+        """
+        Find the programs without uploading the controller tags.  The
+        symbols are walked asking only for their type, then the names
+        of the program symbols are requested.  Falls back to the full
+        controller tag list if no programs are found that way.
+        Saves the names to ProgramNames, returns the status
+        """
+        instances = []
+        instance = 0
+        status = 6
         while status == 6:
-            self.Offset += 1
-            request = self._build_tag_list_request(program_name)
+            request = self._build_tag_list_request(None, [0x02], instance)
             status, ret_data = self.conn.send(request)
+            if status != 0 and status != 6:
+                break
+
+            # instance and symbol type of each symbol
+            for offset in range(50, len(ret_data) - 5, 6):
+                instance, symbol_type = unpack_from('<IH', ret_data, offset)
+                if symbol_type & 0xfff == 0x68:
+                    instances.append(instance)
+            instance += 1
+
+        names = []
+        if status == 0 and instances:
+            services = [self._cip_message(0x03, 0x6b, i, [0x01]) for i in instances]
+            # program names can be up to 40 characters
+            groups = self._pack_services(services, [52] * len(services))
+            for status, ret_data in self._send_requests([self._build_multi_service(g) for g in groups]):
+                if status != 0 or not ret_data:
+                    names = []
+                    break
+                for segment in self._split_multi_service_reply(ret_data):
+                    # service status, attribute count, attribute and its status
+                    if unpack_from('<B', segment, 2)[0] or unpack_from('<H', segment, 8)[0]:
+                        continue
+                    length = unpack_from('<H', segment, 10)[0]
+                    name = str(segment[12:12 + length].decode('utf-8'))
+                    if name.startswith('Program:'):
+                        names.append(name)
+
+        if names:
+            self.ProgramNames = names
+            return 0
+
+        self.ProgramNames = []
+        return self._get_tag_list(False).Status
+
+    def _get_program_tag_lists(self, program_names, as_table=False):
+        """
+        Requests the tag lists of several programs at once, the
+        requests are pipelined, so up to PipelineDepth programs are
+        uploaded at the same time.  Returns the status and the tags
+        of all the programs in order, as a list of Tag type or a
+        TagTable.  On failure, the status is returned with None
+        """
+        pages = [[] for _ in program_names]
+        tables = [TagTable() if as_table else None for _ in program_names]
+        self._send_jobs([self._tag_list_job(program_name, pages[i], tables[i])
+                         for i, program_name in enumerate(program_names)])
+
+        status = 0
+        tags = TagTable() if as_table else []
+        for i in range(len(program_names)):
+            for status, page in pages[i]:
+                if page is None:
+                    return status, None
+                if not as_table:
+                    tags += page
+            if as_table:
+                tags.extend(tables[i])
+
+        return status, tags
+
+    def _tag_list_pages(self, program_name, table=None):
+        """
+        Requests the controller (or program) tag list one packet
+        at a time, yields the status and the list of Tag type from
+        each reply.  On failure, the status is yielded with None.
+        When a TagTable is provided, the tags are added to it instead.
+        """
+        pages = []
+        job = self._tag_list_job(program_name, pages, table)
+        request = next(job)
+        while request is not None:
+            try:
+                request = job.send(self.conn.send(request))
+            except StopIteration:
+                request = None
+            while pages:
+                yield pages.pop(0)
+
+    def _tag_list_job(self, program_name, pages, table=None):
+        """
+        Request job for the controller (or program) tag list, the
+        status and the list of Tag type from each reply are added
+        to pages, None on failure.  When a TagTable is provided,
+        the tags are added to it instead.
+
+        The instance to continue from is kept locally, so reads or
+        writes made between pages, or the pages of other programs,
+        don't break the upload
+        """
+        instance = 0
+        status = 6
+
+        while status == 6:
+            status, ret_data = yield self._build_tag_list_request(program_name, instance=instance)
             if status == 0 or status == 6:
-                tags += self._parse_packet(ret_data, program_name)
+                pages.append((status, self._parse_packet(ret_data, program_name, table)))
+                instance = self._last_instance(ret_data) + 1
             else:
-                return Response(None, None, status)
-
-        return Response(None, tags, status)
+                pages.append((status, None))
+                return
+
+    def _iter_tag_list(self, program_name, resolve_udts):
+        """
+        Yields the tags of the controller (or program) as each
+        packet is parsed, resolving the data type name of each tag
+        """
+        failed = set()
+        for status, page in self._tag_list_pages(program_name):
+            if page is None:
+                raise IOError(Response.get_error_code(status))
+            for tag in page:
+                if tag.Struct and resolve_udts:
+                    if tag.DataTypeValue not in self.UDT and tag.DataTypeValue not in failed:
+                        self._get_templates([tag])
+                        if tag.DataTypeValue not in self.UDT:
+                            failed.add(tag.DataTypeValue)
+                self._set_data_type(tag)
+                yield tag
+
+    def _get_change_counters(self):
+        """
+        Get the change counters of the controller, they change when
+        the project is downloaded or edited.  Returns the raw attribute
+        data, None when the controller doesn't support them
+        """
+        request = self._cip_message(0x03, 0xac, 0x01, [0x01, 0x02, 0x03, 0x04, 0x0a])
+        status, ret_data = self.conn.send(request)
+        if status != 0 or not ret_data:
+            return None
+        return ret_data[50:]
 
     def _get_udt(self, tag_list):
         """
         Request information about UDT makeup.
         Returns the tag list with UDT name appended
         """
+        self.UDT = {}
+        self.UDTByName = {}
+        self.UDTErrors = {}
+
         # get only tags that are a struct
         struct_tags = [x for x in tag_list if x.Struct == 1]
+        self._get_templates(struct_tags)
+
+        for tag in tag_list:
+            self._set_data_type(tag)
+
+        return tag_list
+
+    def _get_templates(self, struct_tags):
+        """
+        Request the templates of the provided struct tags, along with any
+        nested templates they use, that aren't already in UDT.  Each template
+        is saved to UDT and UDTByName, the status of the ones that couldn't
+        be retrieved to UDTErrors
+        """
         # reduce our struct tag list to only unique instances
         seen = set()
         tags = []
         unique = [obj for obj in struct_tags if obj.DataTypeValue not in seen and not seen.add(obj.DataTypeValue)]
 
-        self.UDT = {}
-        self.UDTByName = {}
         template = {}
         while len(unique):
+            instances = [u.DataTypeValue for u in unique if u.DataTypeValue not in self.UDT]
+            attributes = self._get_template_attributes(instances)
+
             iter_template = {}
             for u in unique:
-                if u.DataTypeValue not in self.UDT.keys():
-                    temp = self._get_template_attribute(u.DataTypeValue)
-
-                    block = temp[46:]
-                    if len(block) > 24:
-                        val = unpack_from('<I', block, 10)[0]
-                        words = (val * 4) - 23
-                        size = int(math.ceil(words / 4.0)) * 4
-                        member_count = int(unpack_from('<H', block, 24)[0])
-                        iter_template[u.DataTypeValue] = template[u.DataTypeValue] = [size, '', member_count]
-                    else:
-                        print("Received invalid template attribute for", u.TagName)
+                if u.DataTypeValue not in instances:
+                    continue
+                attribute = attributes.get(u.DataTypeValue, {})
+                if 0x04 in attribute and 0x02 in attribute:
+                    val = attribute[0x04]
+                    words = (val * 4) - 23
+                    size = int(math.ceil(words / 4.0)) * 4
+                    member_count = attribute[0x02]
+                    iter_template[u.DataTypeValue] = template[u.DataTypeValue] = [size, '', member_count,
+                                                                                  attribute.get(0x01),
+                                                                                  attribute.get(0x05, 0)]
+                else:
+                    self.UDTErrors[u.DataTypeValue] = 'Invalid template attributes for {}'.format(u.TagName)
 
+            # templates we've already retrieved from this controller
             unique = []
+            for key, value in list(iter_template.items()):
+                udt = template_cache.get(self._template_key(key, value[3]))
+                if udt is None:
+                    continue
+                del iter_template[key]
+                template[key][1] = udt.Name
+                for field in udt.Fields:
+                    if field.Struct and field.DataTypeValue not in self.UDT:
+                        unique.append(field)
+                self.UDT[key] = udt
+                self.UDTByName[udt.Name] = udt
+
+            failed = {}
+            bodies = self._get_template_bodies(dict((key, value[0]) for key, value in iter_template.items()), failed)
             for key, value in iter_template.items():
-                t = self._get_template(key, value[0])
+                if key not in bodies:
+                    self.UDTErrors[key] = Response.get_error_code(failed.get(key, 1))
+                    continue
+                p = bodies[key]
                 member_count = value[2]
                 size = member_count * 8
-                p = t[50:]
                 member_bytes = p[size:]
                 split_char = pack('<b', 0x00)
                 members = member_bytes.split(split_char)
@@ -911,6 +1719,8 @@ class PLC(object):
                 udt = UDT()
                 udt.Type = key
                 udt.Name = name
+                udt.Handle = value[3]
+                udt.Size = value[4]
                 for i in range(1, member_count + 1):
                     field = Tag()
                     field.UDT = udt
@@ -950,52 +1760,122 @@ class PLC(object):
                     udt.FieldsByName[field.TagName] = field
                 self.UDT[key] = udt
                 self.UDTByName[udt.Name] = udt
+                if udt.Handle is not None:
+                    template_cache[self._template_key(key, udt.Handle)] = udt
 
-        for tag in tag_list:
-            if tag.DataTypeValue in template:
-                tag.DataType = template[tag.DataTypeValue][1]
-            elif tag.SymbolType in self.CIPTypes:
-                tag.DataType = self.CIPTypes[tag.SymbolType][1]
-
-        for type_name, udt in self.UDT.items():
-            for field in udt.Fields:
-                if field.DataTypeValue in template:
-                    field.DataType = template[field.DataTypeValue][1]
-                elif field.SymbolType in self.CIPTypes:
-                    field.DataType = self.CIPTypes[field.SymbolType][1]
+            # nested templates, only request each once
+            seen = set()
+            unique = [obj for obj in unique if obj.DataTypeValue not in seen and not seen.add(obj.DataTypeValue)]
 
-        return tag_list
+        # the nested templates are known now, name the members
+        for key in template:
+            if key in self.UDT:
+                for field in self.UDT[key].Fields:
+                    self._set_data_type(field)
 
-    def _get_template_attribute(self, instance):
+    def _template_key(self, instance, handle):
         """
-        Get the attributes of a UDT
+        Templates are cached by the controller, the template
+        instance and the structure handle, which changes when
+        the UDT definition changes
         """
-        request = self._cip_message(0x03, 0x6c, instance, [0x04, 0x03, 0x02, 0x01])
-        status, ret_data = self.conn.send(request)
-        return ret_data
+        return self.IPAddress, self.Port, self.ProcessorSlot, str(self.Route), instance, handle
+
+    def _set_data_type(self, tag):
+        """
+        Set the UDT name as the data type of a struct tag or UDT
+        member, atomic type names are looked up by the Tag itself
+        """
+        if tag.Struct and tag.DataTypeValue in self.UDT:
+            tag.DataType = self.UDT[tag.DataTypeValue].Name
 
-    def _get_template(self, instance, data_len):
+    def _get_template_attributes(self, instances):
         """
-        Get the members of a UDT, so we can get it
+        Get the attributes of several UDT's, the requests are batched
+        into multiple service packets.  Returns a dict of instance:attributes
+        """
+        services = [self._template_attribute_service(instance) for instance in instances]
+        # each reply is about 40 bytes
+        groups = self._pack_services(services, [40] * len(services))
+
+        attributes = {}
+        index = 0
+        for group, (status, ret_data) in zip(groups, self._send_requests(
+                [self._build_multi_service(group) for group in groups])):
+            segments = self._split_multi_service_reply(ret_data) if ret_data else []
+            for i in range(len(group)):
+                if i < len(segments):
+                    attributes[instances[index]] = self._parse_template_attributes(segments[i], 4)
+                index += 1
+
+        return attributes
+
+    def _template_attribute_service(self, instance):
+        """
+        Build the request for the attributes of a UDT
+        """
+        return self._cip_message(0x03, 0x6c, instance, [0x04, 0x03, 0x02, 0x01, 0x05])
+
+    def _parse_template_attributes(self, data, offset=50):
+        """
+        Extract the template attributes from the reply, returns a
+        dict of attribute:value.  Attributes that failed are left out.
+        Offset is where the reply service starts
+
+        0x01 structure handle, 0x02 member count, 0x04 definition
+        size (32 bit words), 0x05 structure size (bytes)
+        """
+        self._is_not_used()
+        attributes = {}
+        if not data or len(data) < offset + 2 or data[offset - 2:offset - 1] != b'\x00':
+            return attributes
+
+        formats = {0x01: ('<H', 2), 0x02: ('<H', 2), 0x03: ('<H', 2), 0x04: ('<I', 4), 0x05: ('<I', 4)}
+        count = unpack_from('<H', data, offset)[0]
+        offset += 2
+        for _ in range(count):
+            attribute, status = unpack_from('<HH', data, offset)
+            offset += 4
+            # failed attributes don't include a value
+            if status or attribute not in formats:
+                continue
+            fmt, size = formats[attribute]
+            attributes[attribute] = unpack_from(fmt, data, offset)[0]
+            offset += size
+
+        return attributes
+
+    def _get_template_bodies(self, templates, failed=None):
+        """
+        Get the member definitions of several UDT's, the reads of
+        the templates are pipelined.  Templates is a dict of
+        instance:size, returns a dict of instance:definitions
+        for the templates that were read completely, the status
+        of the others is saved to the failed dict
+        """
+        bodies = {}
+        failed = {} if failed is None else failed
+        self._send_jobs([self._template_job(instance, data_len, bodies, failed)
+                         for instance, data_len in templates.items()])
+        return bodies
+
+    def _template_job(self, instance, data_len, bodies, failed):
+        """
+        Read the template in as many parts as it takes
         """
         data = b''
         status = 0
-        part_offset = 0
-        remaining = data_len
-        while remaining > 0 and not status:
-            packet_data = pack("<IH", part_offset, remaining)
-            request = self._cip_message(0x4c, 0x6c, instance, None, packet_data)
-            status, ret_data = self.conn.send(request)
-            if status == 6:
-                status = 0
-            if len(data):
-                part = ret_data[50:]
-                ret_data = part
-            data = data + ret_data
-            part_offset = len(data) - 50
-            remaining = data_len - part_offset
+        while len(data) < data_len:
+            request = self._read_template_service(instance, data_len - len(data), len(data))
+            status, ret_data = yield request
+            if status not in (0, 6) or not ret_data:
+                failed[instance] = status
+                return
+            data += ret_data[50:]
+            if status == 0:
+                break
 
-        return data
+        bodies[instance] = data
 
     def _read_template_service(self, instance, data_len, offset=0):
         """
@@ -1315,42 +2195,34 @@ class PLC(object):
         read_service += pack('<I', self.Offset)
         return read_service
 
-    def _add_write_service(self, ioi, write_data, data_type):
+    def _add_write_service(self, ioi, write_data, data_type, struct_handle=None, element_count=None):
         """
-        Add the write command stuff to the tagIOI
+        Add the write command stuff to the tagIOI, struct_handle is the
+        structure handle of a UDT or custom length string, rather than
+        a standard string.  Packed write data needs the element_count
+        when the elements aren't the size of the data type
         """
         request_service = 0x4D
         request_size = int(len(ioi) / 2)
         write_service = pack('<BB', request_service, request_size)
         write_service += ioi
 
+        if element_count is None:
+            if isinstance(write_data, bytes):
+                element_count = len(write_data) // self.CIPTypes[data_type][0]
+            else:
+                element_count = len(write_data)
+
         if data_type == 0xa0:
             type_len = 0x02
-            write_service += pack('<BBHH', data_type, type_len, self.StringID, len(write_data))
+            if struct_handle is None:
+                struct_handle = self.StringID
+            write_service += pack('<BBHH', data_type, type_len, struct_handle, element_count)
         else:
             type_len = 0x00
-            write_service += pack('<BBH', data_type, type_len, len(write_data))
-
-        for value in write_data:
-            if data_type == 0xca or data_type == 0xcb:
-                value = float(value)
-            elif data_type == 0xa0:
-                value = self._make_standard_string(value)
-            elif data_type == 0xda or data_type == 0xd0:
-                value = self._make_special_string(value)
-            try:
-                for i in range(len(value)):
-                    el = value[i]
-                    write_service += pack(self.CIPTypes[data_type][2], el)
-            except Exception:
-                # handling special format for micropython for bools
-                # boolean format ? doesn't exist for upy struct module
-                if self.CIPTypes[data_type][2] == '<?' and is_micropython():
-                    write_service += pack('B', value)
-                else:
-                    write_service += pack(self.CIPTypes[data_type][2], value)
+            write_service += pack('<BBH', data_type, type_len, element_count)
 
-        return write_service
+        return write_service + self._pack_write_data(write_data, data_type)
 
     def _add_mod_write_service(self, ioi, data_type, mask_high, mask_low):
         """
@@ -1373,7 +2245,7 @@ class PLC(object):
 
         return write_request
 
-    def _add_frag_write_service(self, count, ioi, write_data, data_type):
+    def _add_frag_write_service(self, count, ioi, write_data, data_type, struct_handle=None):
         """
         Add the fragmented write command stuff to the tagIOI
         """
@@ -1384,28 +2256,86 @@ class PLC(object):
 
         if data_type == 0xa0:
             request += pack('<BB', data_type, 0x02)
-            request += pack('<H', self.StringID)
+            request += pack('<H', self.StringID if struct_handle is None else struct_handle)
         else:
             request += pack('<H', data_type)
         request += pack('<H', count)
         request += pack('<I', self.Offset)
 
-        for value in write_data:
+        return request + self._pack_write_data(write_data, data_type)
 
+    def _pack_write_data(self, write_data, data_type):
+        """
+        Pack the values to write.  Bytes are already packed, lists of
+        numbers are packed all at once, strings into one buffer
+        """
+        if isinstance(write_data, bytes):
+            return write_data
+
+        fmt = self.CIPTypes[data_type][2]
+        # boolean format ? doesn't exist for upy struct module
+        if fmt == '<?' and is_micropython():
+            fmt = '<B'
+
+        if data_type not in (0xa0, 0xda, 0xd0):
+            values = write_data
+            if data_type == 0xca or data_type == 0xcb:
+                values = [float(value) for value in write_data]
+            try:
+                return pack('<{}{}'.format(len(values), fmt[1:]), *values)
+            except (Exception,):
+                # nested lists and such, pack them one by one below
+                pass
+
+        if data_type == 0xa0:
+            return self._pack_strings(write_data, self._string_layout(self.StringID))
+        if data_type == 0xda or data_type == 0xd0:
+            return b''.join([self._make_special_string(value) for value in write_data])
+
+        packed = []
+        for value in write_data:
             if data_type == 0xca or data_type == 0xcb:
                 value = float(value)
-            elif data_type == 0xa0:
-                value = self._make_standard_string(value)
-            elif data_type == 0xda or data_type == 0xd0:
-                value = self._make_special_string(value)
             try:
                 for i in range(len(value)):
-                    el = value[i]
-                    request += pack(self.CIPTypes[data_type][2], el)
+                    packed.append(pack(fmt, value[i]))
             except Exception:
-                request += pack(self.CIPTypes[data_type][2], value)
-
-        return request
+                packed.append(pack(fmt, value))
+
+        return b''.join(packed)
+
+    def _write_buffer(self, tag_name, value, data_type):
+        """
+        Values that support the buffer protocol (bytes, bytearray,
+        memoryview, array.array) are written as they are, without
+        converting each element.  Returns the little endian bytes,
+        or None when the value isn't a buffer or has to be converted
+        """
+        if isinstance(value, (list, tuple)) or not isinstance(data_type, int):
+            return None
+        if data_type in (0xa0, 0xda, 0xd0, 0xd3) or bit_of_word(tag_name):
+            return None
+
+        try:
+            view = memoryview(value)
+        except (Exception,):
+            return None
+        if getattr(view, 'ndim', 1) == 0:
+            # scalars (numpy) are written as values
+            return None
+
+        element_size = self.CIPTypes[data_type][0]
+        item_size = getattr(view, 'itemsize', 1)
+        if item_size != 1:
+            is_float = getattr(view, 'format', 'B')[-1:] in ('f', 'd')
+            if item_size != element_size or is_float != (data_type in (0xca, 0xcb)) or sys.byteorder != 'little':
+                # array of a different type, or our byte order is backwards
+                return None
+
+        data = view.tobytes() if hasattr(view, 'tobytes') else bytes(view)
+        if len(data) % element_size:
+            raise ValueError('Buffer size is not a multiple of the data type size ({} bytes)'.format(element_size))
+        return data
 
     def _build_multi_service_header(self):
         """
@@ -1414,11 +2344,85 @@ class PLC(object):
         request = self._cip_message(0x0a, 0x02, 0x01)
         return request
 
-    def _build_tag_list_request(self, program_name):
+    def _build_multi_service(self, services):
+        """
+        Build a multiple service packet from the list of services
+        """
+        header = self._build_multi_service_header()
+        service_count = pack("<H", len(services))
+        current_offset = len(services) * 2 + 2
+        offsets = b''
+        for service in services:
+            offsets += pack("<H", current_offset)
+            current_offset += len(service)
+
+        return header + service_count + offsets + b''.join(services)
+
+    def _split_multi_service_reply(self, data):
+        """
+        Slice the multiple service packet reply into the
+        reply of each service
+        """
+        self._is_not_used()
+        data = data[50:]
+        service_count = unpack_from("<H", data, 0)[0]
+        segment_bounds = [unpack_from("<H", data, i*2+2)[0] for i in range(service_count)]
+        segment_bounds.append(len(data))
+
+        return [data[segment_bounds[i]:segment_bounds[i+1]] for i in range(service_count)]
+
+    def _pack_services(self, services, reply_sizes):
+        """
+        Split the services into groups that fit in a multiple service
+        packet, both the request and the expected reply size
+        """
+        groups = []
+        current = []
+        send_packet_size = 30
+        receive_packet_size = 28
+        for service, reply_size in zip(services, reply_sizes):
+            send_packet_size += len(service) + 2
+            receive_packet_size += reply_size + 2
+            if current and (send_packet_size >= self.ConnectionSize or receive_packet_size >= self.ConnectionSize):
+                groups.append(current)
+                current = []
+                send_packet_size = 30 + len(service) + 2
+                receive_packet_size = 28 + reply_size + 2
+            current.append(service)
+        if current:
+            groups.append(current)
+
+        return groups
+
+    def _send_requests(self, requests):
+        """
+        Send the requests, pipelined up to PipelineDepth at a time.
+        Returns the status and reply data for each request, in order
+        """
+        replies = [(1, None)] * len(requests)
+
+        def job(i):
+            replies[i] = yield requests[i]
+
+        self._send_jobs([job(i) for i in range(len(requests))])
+        return replies
+
+    def _send_jobs(self, jobs):
+        """
+        Run request jobs pipelined on the connection, see Connection.pipeline.
+        The Micro800 gets one request at a time
+        """
+        self.conn.pipeline(jobs, 1 if self.Micro800 else self.PipelineDepth)
+
+    def _build_tag_list_request(self, program_name, attributes=None, instance=None):
         """
         Build the request for the PLC tags
         Program scoped tags will pass the program name for the request
+        By default the name, type and dimensions are requested, from
+        the instance, or self.Offset when no instance is given
         """
+        if instance is None:
+            instance = self.Offset
         service = 0x55
         path_segment = b""
 
@@ -1431,19 +2435,22 @@ class PLC(object):
 
         path_segment += pack('<H', 0x6B20)
 
-        if self.Offset < 256:
-            path_segment += pack('<BB', 0x24, self.Offset)
+        if instance < 256:
+            path_segment += pack('<BB', 0x24, instance)
         else:
-            path_segment += pack('<HH', 0x25, self.Offset)
+            path_segment += pack('<HH', 0x25, instance)
 
         path_segment_len = int(len(path_segment) / 2)
-        attribute_count = 0x03
-        symbol_type = 0x02
-        byte_count = 0x08
-        symbol_name = 0x01
-        attributes = pack('<HHHH', attribute_count, symbol_name, symbol_type, byte_count)
+        if attributes is None:
+            symbol_name = 0x01
+            symbol_type = 0x02
+            byte_count = 0x08
+            attributes = [symbol_name, symbol_type, byte_count]
+        attribute_bytes = pack('<H', len(attributes))
+        for attribute in attributes:
+            attribute_bytes += pack('<H', attribute)
         request = pack('<BB', service, path_segment_len)
-        request += path_segment + attributes
+        request += path_segment + attribute_bytes
 
         return request
 
@@ -1482,26 +2489,25 @@ class PLC(object):
         counter = 0
 
         # this is going to check if the data type was a struct
-        # if so, return the raw data
+        # if so, return the raw data, unless it's a string
         if data_type == 0xa0:
-            tmp = unpack_from('<h', data, 2)[0]
-            if tmp != self.StringID:
+            tmp = unpack_from('<H', data, 2)[0]
+            layout = self._string_layout(tmp)
+            if layout is None:
                 d = data[4:4 + len(data)]
                 values.append(d)
                 self.Offset += len(data)
                 return values
 
+            values = self._unpack_strings(data[4:], layout)
+            self.Offset += len(values) * layout[3]
+            return values
+
         while True:
             index = 2 + (counter * data_size)
             if index > num_bytes:
                 break
-            if data_type == 0xa0:
-                index = 4 + (counter * data_size)
-                name_len = unpack_from('<L', data, index)[0]
-                s = data[index + 4:index + 4 + name_len]
-                values.append(str(s.decode(self.StringEncoding)))
-
-            elif data_type == 0xda or data_type == 0xd0:
+            if data_type == 0xda or data_type == 0xd0:
                 # remove the data type
                 data = data[2:]
                 while len(data) > 0:
@@ -1591,6 +2597,7 @@ class PLC(object):
             data_type = unpack_from('<B', ret_data, 50)[0]
             if data_type == 0xa0:
                 data_len = len(ret_data[54:])
+                self._struct_handles[base_tag] = unpack_from('<H', ret_data, 52)[0]
             else:
                 data_len = len(ret_data[52:])
             self.KnownTags[base_tag] = (data_type, data_len)
@@ -1598,12 +2605,13 @@ class PLC(object):
         else:
             return tag, None, status
 
-    def _convert_write_data(self, tag, data_type, write_values):
+    def _convert_write_data(self, tag, data_type, write_values, bytes_per_value=None):
         """
         In order to handle write requests that are larger than a single
         packet, we'll break up the values to write into multiple lists
         of values.  The size of each list will be calculated based on the
-        connection size, length of the tag name and the data type.
+        connection size, length of the tag name and the data type, or
+        bytes_per_value for custom length strings.
         """
         # packet header is always 110 bytes
         packet_overhead = 110
@@ -1613,7 +2621,8 @@ class PLC(object):
         space_for_payload = self.ConnectionSize - packet_overhead - tag_length
 
         # calculate how many bytes per value are required
-        bytes_per_value = self.CIPTypes[data_type][0]
+        if bytes_per_value is None:
+            bytes_per_value = self.CIPTypes[data_type][0]
         # calculate the limit for values in each request
         limit = int(space_for_payload / bytes_per_value)
         # split the list up into multiple smaller lists
@@ -1622,6 +2631,9 @@ class PLC(object):
             # each chunk individually
             chunks = [write_values]
         else:
+            if isinstance(write_values, bytes):
+                # already packed, split on element boundaries
+                limit *= bytes_per_value
             chunks = [write_values[x:x + limit] for x in range(0, len(write_values), limit)]
 
         return chunks
@@ -1650,93 +2662,70 @@ class PLC(object):
         """
         Extract the values from the multi-service message reply
         """
-        data = data[50:]
-        service_count = unpack_from("<H", data, 0)[0]
-        offsets = [unpack_from("<H", data, i*2+2)[0] for i in range(service_count)]
+        segments = self._split_multi_service_reply(data)
+        return [self._parse_read_segment(segment, tag) for segment, tag in zip(segments, tags)]
 
-        # define the start/end offsets so we can extract the values
-        segment_bounds = [offset for offset in offsets]
-        segment_bounds.append(len(data))
-
-        # slice the data into each response segment
-        data_segments = []
-        for i in range(service_count):
-            data_segments.append(data[segment_bounds[i]:segment_bounds[i+1]])
+    def _parse_read_segment(self, segment, tag):
+        """
+        Extract the value from the reply of one read service
+        """
+        status = unpack_from("<B", segment, 2)[0]
+        tag_name, base_tag, index = parse_tag_name(tag[0])
+        if status == 0:
+            data_type = unpack_from("<B", segment, 4)[0]
 
-        reply = []
-        for i, segment in enumerate(data_segments):
-            status = unpack_from("<B", segment, 2)[0]
-            tag_name, base_tag, index  = parse_tag_name(tags[i][0])
-            if status == 0:
-                data_type = unpack_from("<B", segment, 4)[0]
+            # get the number of byte the value occupies
+            if data_type == 0xa0:
+                data_len = len(segment[8:])
+            else:
+                data_len = len(segment[6:])
 
-                # get the number of byte the value occupies
-                if data_type == 0xa0:
-                    data_len = len(segment[8:])
+            self.KnownTags[base_tag] = (data_type, data_len)
+            # extract the value from the segment
+            if data_type == 0xa0:
+                struct_id = unpack_from("<H", segment, 6)[0]
+                self._struct_handles[base_tag] = struct_id
+                layout = self._string_layout(struct_id)
+                if layout is not None:
+                    value = self._unpack_strings(segment[8:], layout)[0]
                 else:
-                    data_len = len(segment[6:])
-
-                self.KnownTags[base_tag] = (data_type, data_len)
-                # extract the value from the segment
-                if data_type == 0xa0:
-                    struct_id = unpack_from("<H", segment, 6)[0]
-                    if struct_id == self.StringID:
-                        name_length = unpack_from("<I", segment, 8)[0]
-                        value = segment[12:12+name_length].decode(self.StringEncoding)
-                    else:
-                        value = segment[12:12+data_len]
-                elif data_type == 0xd3 or bit_of_word(tag_name):
-                    type_fmt = self.CIPTypes[data_type][2]
-                    value = unpack_from(type_fmt, segment, 6)[0]
-                    value = self._words_to_bits(tag_name, [value], 1)[0]
-                elif data_type == 0xc1 and is_micropython():
-                    type_fmt = "b"
-                    value = unpack_from(type_fmt, segment, 6)[0]
-                    if value == 1:
-                        value = True
-                    else:
-                        value = False
+                    value = segment[12:12+data_len]
+            elif data_type == 0xd3 or bit_of_word(tag_name):
+                type_fmt = self.CIPTypes[data_type][2]
+                value = unpack_from(type_fmt, segment, 6)[0]
+                value = self._words_to_bits(tag_name, [value], 1)[0]
+            elif data_type == 0xc1 and is_micropython():
+                type_fmt = "b"
+                value = unpack_from(type_fmt, segment, 6)[0]
+                if value == 1:
+                    value = True
                 else:
-                    type_fmt = self.CIPTypes[data_type][2]
-                    value = unpack_from(type_fmt, segment, 6)[0]
+                    value = False
             else:
-                value = None
-
-            response = [tag_name, value, status]
-            reply.append(response)
+                type_fmt = self.CIPTypes[data_type][2]
+                value = unpack_from(type_fmt, segment, 6)[0]
+        else:
+            value = None
 
-        return reply
+        return [tag_name, value, status]
 
-    def _parse_multi_write(self, write_data, data):
-        # remove the beginning of the packet because we just don't care about it
+    def _last_instance(self, data):
+        """
+        Instance of the last tag in a tag list reply
+        """
         self._is_not_used()
-        stripped = data[50:]
-        tag_count = unpack_from('<H', stripped, 0)[0]
-
-        # get the offset values for each of the tags in the packet
-        offsets = []
-        for i in range(tag_count):
-            loc = i * 2 + 2
-            offsets.append(unpack_from('<H', stripped, loc)[0])
-
-        reply = []
-        for i, offset in enumerate(offsets):
-            status = unpack_from('<B', stripped, offset + 2)[0]
-            
-            # only return value list if the original request was multiple
-            if len(write_data[i][1]) == 1:
-                tag = write_data[i][0]
-                value = write_data[i][1][0]
-            else:
-                tag = write_data[i][0]
-                value = write_data[i][1]
-
-            response = Response(tag, value, status)
-            reply.append(response)
-
-        return reply
+        packet_start = 50
+        instance = 0
+        while packet_start < len(data):
+            instance = unpack_from('<I', data, packet_start)[0]
+            packet_start += unpack_from('<H', data, packet_start + 4)[0] + 20
+        return instance
 
-    def _parse_packet(self, data, program_name):
+    def _parse_packet(self, data, program_name, table=None):
+        """
+        Extract the tags from a tag list reply and return them as a
+        list of Tag type, or add them to the TagTable when one is provided
+        """
         # the first tag in a packet starts at byte 50
         packet_start = 50
         tag_list = []
@@ -1748,49 +2737,77 @@ class PLC(object):
             packet = data[packet_start:packet_start + tag_len + 20]
             # extract the offset
             self.Offset = unpack_from('<H', packet, 0)[0]
-            # add the tag to our tag list
-            tag = Tag.parse(packet, program_name)
 
-            # filter out garbage
-            if Tag.in_filter(tag.TagName):
-                pass
+            if table is not None:
+                # the table filters out the garbage itself
+                tag_name = table.parse(packet, program_name)
             else:
-                tag_list.append(tag)
+                # add the tag to our tag list
+                tag = Tag.parse(packet, program_name)
+                tag_name = tag.TagName
+
+                # filter out garbage
+                if Tag.in_filter(tag.TagName):
+                    pass
+                else:
+                    tag_list.append(tag)
 
             if not program_name:
-                if 'Program:' in tag.TagName:
-                    self.ProgramNames.append(tag.TagName)
+                if 'Program:' in tag_name:
+                    self.ProgramNames.append(tag_name)
             # increment ot the next tag in the packet
             packet_start = packet_start + tag_len + 20
 
+        if table is not None:
+            return table
         return tag_list
 
-    def _make_standard_string(self, string):
+    def _string_layout(self, handle):
         """
-        String for Compact/Control Logix
+        Layout of the string type with the structure handle, the standard
+        STRING or a custom length string from the UDT templates.  Returns
+        (LEN offset, DATA offset, DATA size, size of the string), or None
+        when the handle isn't a string type we know of
         """
-        work = []
-        string = string[:82]
-        temp = pack('<I', len(string)).decode(self.StringEncoding)
-        for char in temp:
-            work.append(ord(char))
-        for char in string:
-            work.append(ord(char))
-        for _ in range(len(string), 84):
-            work.append(0x00)
-        return work
+        if handle == self.StringID:
+            return 0, 4, 82, 88
+        for udt in self.UDT.values():
+            if udt.Handle == handle and is_string(udt):
+                return string_layout(udt)
+        return None
+
+    def _pack_strings(self, strings, layout):
+        """
+        Pack strings for Compact/Control Logix into one buffer
+        """
+        len_offset, data_offset, data_size, size = layout
+        buffer = bytearray(size * len(strings))
+        for i, string in enumerate(strings):
+            encoded = string.encode(self.StringEncoding)[:data_size]
+            pack_into('<i', buffer, i * size + len_offset, len(encoded))
+            start = i * size + data_offset
+            buffer[start:start + len(encoded)] = encoded
+        return bytes(buffer)
+
+    def _unpack_strings(self, data, layout):
+        """
+        Unpack Compact/Control Logix strings, data is the
+        strings without the data type and structure handle
+        """
+        len_offset, data_offset, data_size, size = layout
+        values = []
+        for start in range(0, len(data) - size + 1, size):
+            length = min(unpack_from('<i', data, start + len_offset)[0], data_size)
+            start += data_offset
+            values.append(str(data[start:start + max(length, 0)].decode(self.StringEncoding)))
+        return values
 
     def _make_special_string(self, string):
         """
         String for Micro800 and other platforms
         """
-        work = []
-        temp = pack('<B', len(string)).decode(self.StringEncoding)
-        for char in temp:
-            work.append(ord(char))
-        for char in string:
-            work.append(ord(char))
-        return work
+        encoded = string.encode(self.StringEncoding)
+        return pack('<B', len(encoded)) + encoded
 
     def _is_not_used(self):
         pass
@@ -1929,6 +2946,31 @@ def mod_write_masks(tag, values, bpw):
     return values_high, values_low, tags
 
 
+def merge_write_masks(high, low, new_high, new_low, bpw):
+    """
+    Merge the masks of two read modify writes to the same word,
+    the bits set in the new masks replace the bits in the old masks
+    """
+    full = (1 << bpw) - 1
+    high &= full
+    low &= full
+    new_high &= full
+    new_low &= full
+
+    # bits the new masks set or clear
+    changed = (new_high | ~new_low) & full
+    high = (high & ~changed) | new_high
+    low = (low | changed) & new_low
+
+    # back to signed values, like bin_to_int
+    if high > 2 ** (bpw - 1) - 1:
+        high -= 2 ** bpw
+    if low > 2 ** (bpw - 1) - 1:
+        low -= 2 ** bpw
+
+    return high, low
+
+
 def bit_of_word(tag):
     """
     Test if the user is trying to write to a bit of a word
@@ -39,6 +39,7 @@ class Connection(object):
         self.listen_ip = ""
         self.callback = None
 
+        self._buffer = b''
         self._connected = False
         self._context = 0x00
         self._context_index = 0
@@ -77,6 +78,66 @@ class Connection(object):
         
         return self._get_bytes(eip_header, connected)
 
+    def pipeline(self, jobs, depth):
+        """
+        Send the requests of several jobs over the connected session,
+        keeping up to depth requests in flight rather than waiting for
+        each reply before sending the next request.
+
+        Jobs are generators that yield a request and are sent the
+        status and data of its reply, so a job can make requests that
+        depend on the previous reply.  Replies are matched to their
+        request by the sequence count.  If the connection fails, the
+        jobs get a status of 1 and no data for their remaining requests.
+        """
+        depth = max(1, depth)
+        jobs = list(jobs)
+        started = 0
+        # jobs that got their reply go before the jobs that haven't started
+        ready = []
+        pending = {}
+        failed = False
+        while ready or pending or started < len(jobs):
+            while (ready or started < len(jobs)) and len(pending) < depth:
+                if ready:
+                    job, reply = ready.pop(0)
+                else:
+                    job, reply = jobs[started], None
+                    started += 1
+                try:
+                    request = job.send(reply)
+                except StopIteration:
+                    continue
+
+                if failed:
+                    ready.append([job, (1, None)])
+                    continue
+
+                sequence = self._sequence_counter
+                try:
+                    self.Socket.send(self._build_eip_header(request))
+                    pending[sequence] = job
+                except (Exception,):
+                    self.SocketConnected = False
+                    failed = True
+                    ready.append([job, (1, None)])
+
+            if not pending:
+                continue
+
+            ret_data = self.receive_data()
+            if not ret_data:
+                self.SocketConnected = False
+                failed = True
+                ready.extend([job, (1, None)] for job in pending.values())
+                pending = {}
+                continue
+
+            job = pending.pop(unpack_from('<H', ret_data, 44)[0], None)
+            if job is not None:
+                status = unpack_from('<B', ret_data, 48)[0]
+                ready.append([job, (status, ret_data)])
+
     def listen(self, ip_address, callback, port):
         """ Listen for CIP Data Table Write (0x4d) messages
         from the PLC, decode send the data to the callback
@@ -117,6 +178,7 @@ class Connection(object):
                 pass
             self.Socket = socket.socket()
             self.Socket.settimeout(self.parent.SocketTimeout)
+            self._buffer = b''
             addr = socket.getaddrinfo(self.parent.IPAddress, self.parent.Port)[0][-1]
             self.Socket.connect(addr)
         # Changed to a more generic exception class as mpy does not have socket.error
@@ -217,21 +279,30 @@ class Connection(object):
         incomplete data.  The initial packet that comes in contains
         the length of the payload.  We can use that to keep calling
         socket receive until the entire payload is received.  This only happens
-        when using LargeForwardOpen
+        when using LargeForwardOpen.  When requests are pipelined, one
+        receive can hold more than one reply, what's left over is kept
+        for the next call
         """
-        data = b''
+        data = self._buffer
+        self._buffer = b''
         try:
-            part = self.Socket.recv(4096)
-            payload_len = unpack_from('<H', part, 2)[0]
-            data += part
+            while len(data) < 24:
+                part = self.Socket.recv(4096)
+                if not part:
+                    return None
+                data += part
+            frame_len = unpack_from('<H', data, 2)[0] + 24
 
-            while len(data)-24 < payload_len:
+            while len(data) < frame_len:
                 part = self.Socket.recv(4096)
+                if not part:
+                    return None
                 data += part
         except (Exception, ):
             return None
 
-        return data
+        self._buffer = data[frame_len:]
+        return data[:frame_len]
 
     def _wait_for_connection(self):
         """ Wait for the incoming connection request.  This happens prior
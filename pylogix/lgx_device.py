@@ -19,6 +19,8 @@ from struct import pack, unpack_from
 
 
 class Device(object):
+    __slots__ = ('Length', 'EncapsulationVersion', 'IPAddress', 'VendorID', '_vendor', 'DeviceID', '_device_type',
+                 'ProductCode', 'Revision', 'Status', 'SerialNumber', 'ProductNameLength', 'ProductName', 'State')
 
     def __init__(self):
         # structure of a logix device
@@ -26,9 +28,9 @@ class Device(object):
         self.EncapsulationVersion = None
         self.IPAddress = None
         self.VendorID = None
-        self.Vendor = None
+        self._vendor = None
         self.DeviceID = None
-        self.DeviceType = None
+        self._device_type = None
         self.ProductCode = None
         self.Revision = None
         self.Status = None
@@ -37,6 +39,32 @@ class Device(object):
         self.ProductName = None
         self.State = None
 
+    @property
+    def Vendor(self):
+        """
+        The vendor name is only looked up when asked for
+        """
+        if self._vendor is None and self.VendorID is not None:
+            self._vendor = Device.get_vendor(self.VendorID)
+        return self._vendor
+
+    @Vendor.setter
+    def Vendor(self, vendor):
+        self._vendor = vendor
+
+    @property
+    def DeviceType(self):
+        """
+        The device type name is only looked up when asked for
+        """
+        if self._device_type is None and self.DeviceID is not None:
+            self._device_type = Device.get_device(self.DeviceID)
+        return self._device_type
+
+    @DeviceType.setter
+    def DeviceType(self, device_type):
+        self._device_type = device_type
+
     def __repr__(self):
 
         props = ''
@@ -107,10 +135,7 @@ class Device(object):
             resp.IPAddress = socket.inet_ntoa(pack('<L', long_ip))
 
         resp.VendorID = unpack_from('<H', data, 48)[0]
-        resp.Vendor = Device.get_vendor(resp.VendorID)
-
         resp.DeviceID = unpack_from('<H', data, 50)[0]
-        resp.DeviceType = Device.get_device(resp.DeviceID)
 
         resp.ProductCode = unpack_from('<H', data, 52)[0]
         major = unpack_from('<B', data, 54)[0]
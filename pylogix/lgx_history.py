@@ -0,0 +1,307 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import time
+
+from array import array
+
+from .eip import bit_of_word, parse_tag_name
+from .lgx_response import Response
+
+try:
+    import threading
+except ImportError:
+    # micropython
+    threading = None
+
+
+class TagHistory(object):
+    """
+    The last size samples of each tag, kept in memory.  Values are
+    stored in an array.array per tag, typed from the CIP data type
+    (REAL in 'f', DINT in 'i' ...), the timestamps in one array shared
+    by all the tags.  Strings and structures are kept in lists.
+
+    Each Add is a sample, tags that aren't in it keep their last value,
+    so a batch of only the tags that changed (ReadPlan.ReadChanges) can
+    be added.  Failed reads are stored as missing values.  Timestamps
+    are expected to increase, the oldest samples are overwritten once
+    the history is full.
+    """
+
+    def __init__(self, plc, size):
+
+        self.PLC = plc
+        self.Size = size
+        self.Timestamps = array('d', [0.0]) * size
+
+        self._head = 0
+        self._count = 0
+        self._rings = {}
+        self._lock = threading.Lock() if threading else None
+
+    def __len__(self):
+
+        return self._count
+
+    def __repr__(self):
+
+        return 'TagHistory(Tags={}, Samples={}, Size={})'.format(len(self._rings), self._count, self.Size)
+
+    @property
+    def Tags(self):
+        """
+        Names of the tags in the history
+        """
+        return [ring.TagName for ring in self._rings.values()]
+
+    def Add(self, responses, timestamp=None):
+        """
+        Add a sample, a Response or a list of them read
+        at timestamp (now by default)
+        """
+        if isinstance(responses, Response):
+            responses = [responses]
+        if timestamp is None:
+            timestamp = time.time()
+
+        self._acquire()
+        try:
+            slot = self._head
+            previous = (slot - 1) % self.Size
+            self.Timestamps[slot] = timestamp
+
+            updated = set()
+            for response in responses:
+                key = response.TagName.lower()
+                ring = self._rings.get(key)
+                if ring is None:
+                    typecode, boolean = self._typecode(response.TagName)
+                    ring = self._rings[key] = _Ring(response.TagName, typecode, self.Size, boolean)
+                ring._set(slot, response.Value if response.Status == 'Success' else None)
+                updated.add(key)
+
+            for key, ring in self._rings.items():
+                if key not in updated:
+                    ring._copy(previous, slot)
+
+            self._head = (slot + 1) % self.Size
+            self._count = min(self._count + 1, self.Size)
+        finally:
+            self._release()
+
+    def Log(self, timestamp, responses):
+        """
+        Add a sample, can be used as the Sample callback
+        """
+        self.Add(responses, timestamp)
+
+    def Query(self, tag, start=None, end=None):
+        """
+        Samples of a tag from start to end (timestamps, both included),
+        returns the timestamps and the values, missing values are left out
+        """
+        self._acquire()
+        try:
+            ring = self._rings.get(tag.lower())
+            times = array('d')
+            if ring is None:
+                return times, []
+
+            values = ring.Values[:0]
+            for first, last in self._slices(*self._range(start, end)):
+                if ring._all_valid(first, last):
+                    times.extend(self.Timestamps[first:last])
+                    values += ring.Values[first:last]
+                    continue
+                for i in range(first, last):
+                    if ring._valid(i):
+                        times.append(self.Timestamps[i])
+                        values.append(ring.Values[i])
+            if ring.Bool:
+                # stored as 0 and 1
+                values = [bool(value) for value in values]
+            return times, values
+        finally:
+            self._release()
+
+    def Downsample(self, tag, interval, start=None, end=None, method='mean'):
+        """
+        Samples of a tag from start to end reduced to one value per
+        interval seconds, the mean, min, max, first or last value of
+        the samples in each interval.  Returns the start of each
+        interval and the values, intervals without samples are left out
+        """
+        if method not in _METHODS:
+            raise ValueError('Unknown method {}'.format(method))
+
+        times, values = self.Query(tag, start, end)
+        out_times = array('d')
+        out_values = []
+        bucket = None
+        samples = []
+        for timestamp, value in zip(times, values):
+            this = timestamp // interval
+            if this != bucket:
+                if samples:
+                    out_times.append(bucket * interval)
+                    out_values.append(_METHODS[method](samples))
+                bucket = this
+                samples = []
+            samples.append(value)
+        if samples:
+            out_times.append(bucket * interval)
+            out_values.append(_METHODS[method](samples))
+        return out_times, out_values
+
+    def _range(self, start, end):
+        """
+        Samples from start to end, as a range of
+        sample numbers, oldest sample is 0
+        """
+        lo = 0 if start is None else self._search(start, False)
+        hi = self._count if end is None else self._search(end, True)
+        return lo, max(lo, hi)
+
+    def _search(self, timestamp, after):
+        """
+        Number of the first sample at timestamp, or after timestamp
+        """
+        oldest = (self._head - self._count) % self.Size
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.Timestamps[(oldest + mid) % self.Size]
+            if value < timestamp or (after and value == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slices(self, lo, hi):
+        """
+        Sample numbers to at most two ranges of slots of the rings
+        """
+        oldest = (self._head - self._count) % self.Size
+        first = (oldest + lo) % self.Size
+        count = hi - lo
+        if not count:
+            return []
+        if first + count <= self.Size:
+            return [(first, first + count)]
+        return [(first, self.Size), (0, first + count - self.Size)]
+
+    def _typecode(self, tag_name):
+        """
+        array typecode of the tag from its data type, None for the
+        ones kept in a list, and whether the values are BOOL
+        """
+        tag, base_tag, index = parse_tag_name(tag_name)
+        data_type = self.PLC.KnownTags.get(base_tag, (None,))[0]
+        if bit_of_word(tag_name) or data_type in (0xc1, 0xd3):
+            return 'b', True
+        return _TYPECODES.get(data_type), False
+
+    def _acquire(self):
+
+        if self._lock is not None:
+            self._lock.acquire()
+
+    def _release(self):
+
+        if self._lock is not None:
+            self._lock.release()
+
+
+class _Ring(object):
+    """
+    The values of a tag, with a bit per slot that is set while the slot
+    is missing, so the history of a tag added later starts out missing.
+    BOOL values are stored as 0 and 1
+    """
+    __slots__ = ('TagName', 'Values', 'Bool', '_missing')
+
+    def __init__(self, tag_name, typecode, size, boolean=False):
+
+        self.TagName = tag_name
+        self.Bool = boolean
+        if typecode is None:
+            self.Values = [None] * size
+        else:
+            self.Values = array(typecode, [0]) * size
+        self._missing = bytearray(b'\xff' * ((size + 7) // 8))
+
+    def _set(self, slot, value):
+
+        if value is not None:
+            try:
+                self.Values[slot] = value
+                self._missing[slot >> 3] &= ~(1 << (slot & 7)) & 0xff
+                return
+            except (TypeError, OverflowError):
+                pass
+        self._missing[slot >> 3] |= 1 << (slot & 7)
+
+    def _copy(self, source, slot):
+        """
+        Carry the value of a tag that wasn't in the sample
+        """
+        if self._valid(source):
+            self._set(slot, self.Values[source])
+        else:
+            self._missing[slot >> 3] |= 1 << (slot & 7)
+
+    def _valid(self, slot):
+
+        return not self._missing[slot >> 3] & (1 << (slot & 7))
+
+    def _all_valid(self, first, last):
+
+        return not self._missing[first >> 3:(last + 7) >> 3].strip(b'\x00')
+
+
+def _mean(values):
+
+    return sum(values) / float(len(values))
+
+
+_METHODS = {'mean': _mean,
+            'min': min,
+            'max': max,
+            'first': lambda values: values[0],
+            'last': lambda values: values[-1]}
+
+# array typecodes of the atomic data types,
+# 64 bit integers are doubles when there is no 'q'
+try:
+    array('q')
+    _LONG, _ULONG = 'q', 'Q'
+except ValueError:
+    _LONG, _ULONG = 'd', 'd'
+
+_TYPECODES = {0xc1: 'b',
+              0xc2: 'b',
+              0xc3: 'h',
+              0xc4: 'i',
+              0xc5: _LONG,
+              0xc6: 'B',
+              0xc7: 'H',
+              0xc8: 'I',
+              0xc9: _ULONG,
+              0xca: 'f',
+              0xcb: 'd',
+              0xd1: 'B',
+              0xd2: 'H'}
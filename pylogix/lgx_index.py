@@ -0,0 +1,415 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import re
+
+from array import array
+from struct import unpack_from
+
+from .lgx_tag import cip_data_types
+
+
+class TagIndex(object):
+    """
+    Index of the tag list retrieved with GetTagList, so tags can be
+    looked up by name, name prefix, program, data type or array-ness
+    without scanning the whole list.
+
+    Tag names in Logix are not case sensitive, neither are the lookups.
+    """
+    __slots__ = ('Tags', 'UDT', '_by_name', '_names', '_sorted_tags', '_by_program', '_by_data_type',
+                 '_by_data_type_value', '_by_array')
+
+    def __init__(self, tag_list, udts=None):
+
+        self.Tags = list(tag_list)
+        self.UDT = udts if udts is not None else {}
+
+        self._by_name = {}
+        self._by_program = {}
+        self._by_data_type = {}
+        self._by_data_type_value = {}
+        self._by_array = {True: [], False: []}
+
+        for tag in self.Tags:
+            self._by_name[tag.TagName.lower()] = tag
+
+            if tag.TagName.startswith('Program:') and '.' in tag.TagName:
+                program = tag.TagName.split('.')[0].lower()
+            else:
+                program = None
+            self._by_program.setdefault(program, []).append(tag)
+
+            self._by_data_type.setdefault(tag.DataType, []).append(tag)
+            self._by_data_type_value.setdefault(tag.DataTypeValue, []).append(tag)
+            self._by_array[bool(tag.Array)].append(tag)
+
+        # sorted names are our prefix tree, a binary search finds the
+        # first name with the prefix, the rest follow it
+        self._names = sorted(self._by_name)
+        self._sorted_tags = [self._by_name[n] for n in self._names]
+
+    def __len__(self):
+
+        return len(self.Tags)
+
+    def __contains__(self, tag_name):
+
+        return self.Find(tag_name) is not None
+
+    def __repr__(self):
+
+        return 'TagIndex(Tags={}, UDT={})'.format(len(self.Tags), len(self.UDT))
+
+    def __str__(self):
+
+        return '{} tags {} UDTs'.format(len(self.Tags), len(self.UDT))
+
+    def Find(self, tag_name):
+        """
+        Find a tag by its name.  Member paths (MyUDT.Member[2].Value)
+        return the UDT member.  Returns None when not found.
+        """
+        tag = self._by_name.get(tag_name.lower())
+        if tag is not None:
+            return tag
+
+        root, members = self._split(tag_name)
+        tag = self._by_name.get(root.lower())
+        if tag is None:
+            return None
+
+        for member in members:
+            udt = self._udt_of(tag)
+            if udt is None:
+                return None
+            tag = self._field(udt, member)
+            if tag is None:
+                return None
+        return tag
+
+    def StartsWith(self, prefix):
+        """
+        Get the names of all the tags that start with the prefix,
+        ex: Program:MainProgram. returns all the MainProgram tags.
+
+        When the prefix goes past a struct tag name, the names of
+        the matching members one level down are returned instead,
+        ex: MyUDT.Mo returns MyUDT.Motor, MyUDT.Mode
+        """
+        lower = prefix.lower()
+        names = []
+        i = _bisect_left(self._names, lower)
+        while i < len(self._names) and self._names[i].startswith(lower):
+            names.append(self._sorted_tags[i].TagName)
+            i += 1
+
+        if names or '.' not in prefix:
+            return names
+
+        # prefix ends inside the members of a struct tag
+        parent, _, partial = prefix.rpartition('.')
+        tag = self.Find(parent)
+        udt = self._udt_of(tag) if tag is not None else None
+        if udt is None:
+            return names
+
+        partial = partial.lower()
+        for field in udt.Fields:
+            if field.TagName.lower().startswith(partial) and not _hidden(field):
+                names.append('{}.{}'.format(parent, field.TagName))
+        return names
+
+    def ByProgram(self, program_name=None):
+        """
+        Get the tags of a program, ex: Program:MainProgram.
+        No program name returns the controller tags
+        """
+        if program_name:
+            program_name = program_name.lower()
+        return self._by_program.get(program_name, [])
+
+    def ByDataType(self, data_type):
+        """
+        Get the tags by data type name, ex: DINT or the UDT name
+        """
+        return self._by_data_type.get(data_type, [])
+
+    def ByDataTypeValue(self, data_type_value):
+        """
+        Get the tags by data type value, ex: 0xc4 or the UDT template
+        """
+        return self._by_data_type_value.get(data_type_value, [])
+
+    def ByArray(self, is_array=True):
+        """
+        Get the array tags, or with is_array=False, the tags that aren't arrays
+        """
+        return self._by_array[bool(is_array)]
+
+    def Members(self, tag_name):
+        """
+        Expand a struct tag into the paths of all its leaf members.
+        Struct arrays are expanded to each element, atomic arrays and
+        strings are returned as a single path.
+        """
+        tag = self.Find(tag_name)
+        if tag is None:
+            return []
+
+        if _udt_of(tag, self.UDT) is None:
+            return [tag_name]
+
+        leaves = LeafTable(self.UDT)
+        leaves.add(tag, name=tag_name)
+        return leaves.TagNames
+
+    def _udt_of(self, tag):
+        """
+        The UDT of a struct tag, strings are treated
+        as atomic so that they are not expanded
+        """
+        return _udt_of(tag, self.UDT)
+
+    def _field(self, udt, member):
+        """
+        Case insensitive lookup of a UDT member
+        """
+        return find_field(udt, member)
+
+    def _split(self, tag_name):
+        """
+        Split a tag name into the root tag and the member names,
+        without the array indexes, program scope stays with the root
+        """
+        segments = re.sub(r'\[[^\]]*\]', '', tag_name).split('.')
+        if segments[0].lower().startswith('program:') and len(segments) > 1:
+            segments = ['{}.{}'.format(segments[0], segments[1])] + segments[2:]
+
+        # bit of word isn't a member
+        if len(segments) > 1 and segments[-1].isdigit():
+            segments = segments[:-1]
+        return segments[0], segments[1:]
+
+
+class LeafTable(object):
+    """
+    Every readable leaf path of a tag list, ex: Line1.Conv[3].Motor.Speed
+    along with its data type value, byte offset within its root tag, the
+    bit for BOOL members and array dimensions, kept in parallel arrays.
+
+    Struct arrays are expanded to each element, atomic arrays and strings
+    are a single leaf.  Indexing returns a tuple of:
+    (TagName, DataType, RootName, Offset, Bit, Dims)
+    """
+    __slots__ = ('TagNames', 'RootNames', 'Roots', 'TypeValues', 'Offsets', 'Bits', 'Dims', 'UDT')
+
+    def __init__(self, udts=None):
+
+        self.TagNames = []
+        self.RootNames = []
+        self.Roots = array('I')
+        self.TypeValues = array('H')
+        self.Offsets = array('I')
+        self.Bits = array('B')
+        # three dimensions per leaf
+        self.Dims = array('I')
+        self.UDT = udts if udts is not None else {}
+
+    def __len__(self):
+
+        return len(self.TagNames)
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += len(self.TagNames)
+
+        return (self.TagNames[index],
+                self.DataType(index),
+                self.RootNames[self.Roots[index]],
+                self.Offsets[index],
+                self.Bits[index],
+                tuple(self.Dims[index * 3:index * 3 + 3]))
+
+    def __iter__(self):
+
+        for i in range(len(self.TagNames)):
+            yield self[i]
+
+    def __repr__(self):
+
+        return 'LeafTable(Leaves={}, Roots={})'.format(len(self.TagNames), len(self.RootNames))
+
+    def __str__(self):
+
+        return '{} leaves {} roots'.format(len(self.TagNames), len(self.RootNames))
+
+    def DataType(self, index):
+        """
+        Get the data type name of a leaf
+        """
+        val = self.TypeValues[index]
+        if val & 0x8000:
+            udt = self.UDT.get(val & 0xfff)
+            return udt.Name if udt else ''
+        if val & 0xff in cip_data_types:
+            return cip_data_types[val & 0xff][1]
+        return ''
+
+    def add(self, tag, dims=None, name=None):
+        """
+        Add the leaves of a tag, walking its UDT for struct tags.
+        Tags only keep the first array dimension, provide the
+        dims from a TagTable for multi-dimension arrays.
+        """
+        if not tag.Struct and tag.SymbolType not in cip_data_types:
+            # programs, routines and such aren't readable
+            return
+
+        if name is None:
+            name = tag.TagName
+        if dims is None:
+            dims = (tag.Size, 0, 0) if tag.Array else (0, 0, 0)
+
+        root = len(self.RootNames)
+        self.RootNames.append(name)
+
+        udt = _udt_of(tag, self.UDT)
+        if udt is None:
+            self._add_leaf(name, root, tag, 0, 0, dims)
+        elif tag.Array and not name.endswith(']'):
+            for i, index in enumerate(_indexes(dims)):
+                self._add_struct('{}[{}]'.format(name, index), root, udt, i * udt.Size)
+        else:
+            self._add_struct(name, root, udt, 0)
+
+    def _add_struct(self, path, root, udt, offset):
+        """
+        Walk the UDT members, adding the leaf members
+        """
+        for field in udt.Fields:
+            if _hidden(field):
+                continue
+
+            member = '{}.{}'.format(path, field.TagName)
+            # the member offset is a UDINT, split in two by the template parsing
+            member_offset = offset + field.Meta + (field.InstanceID << 16)
+            child = _udt_of(field, self.UDT)
+            if child is None:
+                bit = 0
+                if field.SymbolType == 0xc1 and not field.Array and field.Bytes:
+                    bit = unpack_from('<H', field.Bytes, 0)[0]
+                self._add_leaf(member, root, field, member_offset, bit, (field.Size, 0, 0))
+            elif field.Array:
+                for i in range(field.Size):
+                    self._add_struct('{}[{}]'.format(member, i), root, child, member_offset + i * child.Size)
+            else:
+                self._add_struct(member, root, child, member_offset)
+
+    def _add_leaf(self, path, root, tag, offset, bit, dims):
+
+        self.TagNames.append(path)
+        self.Roots.append(root)
+        self.TypeValues.append(tag.DataTypeValue | (tag.Struct << 15))
+        self.Offsets.append(offset)
+        self.Bits.append(bit)
+        self.Dims.extend(dims)
+
+
+def is_string(udt):
+    """
+    Standard and custom length strings are
+    UDT's with only the LEN and DATA members
+    """
+    return sorted(udt.FieldsByName) == ['DATA', 'LEN']
+
+
+def string_layout(udt):
+    """
+    Layout of a standard or custom length string UDT, returns
+    (LEN offset, DATA offset, DATA size, size of the string)
+    """
+    length = udt.FieldsByName['LEN']
+    data = udt.FieldsByName['DATA']
+    # member offsets are a UDINT, split in two by the template parsing
+    return (length.Meta + (length.InstanceID << 16),
+            data.Meta + (data.InstanceID << 16),
+            data.Size,
+            udt.Size)
+
+
+def find_field(udt, member):
+    """
+    Case insensitive lookup of a UDT member,
+    returns None when the UDT doesn't have it
+    """
+    field = udt.FieldsByName.get(member)
+    if field is not None:
+        return field
+
+    member = member.lower()
+    for name, field in udt.FieldsByName.items():
+        if name.lower() == member:
+            return field
+    return None
+
+
+def _bisect_left(names, name):
+    """
+    Index of the first name that isn't before name, like
+    bisect.bisect_left, which micropython doesn't have
+    """
+    lo, hi = 0, len(names)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if names[mid] < name:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _hidden(field):
+    """
+    Hidden members hold the bits of BOOL members, or are internal
+    """
+    return field.TagName.startswith('ZZZZZZZZZZ') or field.TagName.startswith('__')
+
+
+def _udt_of(tag, udts):
+    """
+    The UDT of a struct tag, strings are treated
+    as atomic so that they are not expanded
+    """
+    if not tag.Struct:
+        return None
+    udt = udts.get(tag.DataTypeValue)
+    if udt is None or is_string(udt):
+        return None
+    return udt
+
+
+def _indexes(dims):
+    """
+    Array indexes of all the elements, in the order they are
+    stored in the PLC, ex: (2, 2, 0) gives 0,0 0,1 1,0 1,1
+    """
+    dims = [d for d in dims if d]
+    indexes = ['']
+    for d in dims:
+        indexes = ['{},{}'.format(i, j) if i != '' else str(j) for i in indexes for j in range(d)]
+    return indexes
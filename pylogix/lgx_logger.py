@@ -0,0 +1,368 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import os
+import time
+
+from struct import calcsize, pack, unpack_from
+
+from .eip import bit_of_word, parse_tag_name
+from .lgx_tag import cip_data_types
+from .utils import monotonic
+
+try:
+    import threading
+except ImportError:
+    # micropython
+    threading = None
+
+
+class _FileLogger(object):
+    """
+    Samples are buffered and written to the file in one write every
+    buffer_size samples or flush_interval seconds.  Once the file is
+    larger than max_bytes, it's renamed to path.1 (path.1 to path.2 and
+    so on, keeping backup_count files) and a new file is started.  With
+    fsync_interval, flushed data is synced to the disk at most every
+    fsync_interval seconds, rather than on every write.
+
+    Subclasses make the file format, _make_header returns the bytes
+    the file starts with, _make_record the bytes of a sample.
+    """
+
+    def __init__(self, path, max_bytes=10485760, backup_count=5, buffer_size=1000, flush_interval=1.0,
+                 fsync_interval=None):
+
+        self.Path = path
+        self.MaxBytes = max_bytes
+        self.BackupCount = backup_count
+        self.BufferSize = buffer_size
+        self.FlushInterval = flush_interval
+        self.FsyncInterval = fsync_interval
+
+        self._file = None
+        self._header = None
+        self._buffer = []
+        self._size = 0
+        self._last_flush = monotonic()
+        self._last_fsync = monotonic()
+        self._lock = threading.Lock() if threading else None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.Close()
+
+    def Log(self, timestamp, responses):
+        """
+        Log a sample, the timestamp and the Response of each tag.
+        Can be used as the Sample callback
+        """
+        self._acquire()
+        try:
+            if self._header is None:
+                self._header = self._make_header(responses)
+                self._open()
+            self._buffer.append(self._make_record(timestamp, responses))
+            if len(self._buffer) >= self.BufferSize or monotonic() - self._last_flush >= self.FlushInterval:
+                self._flush()
+        finally:
+            self._release()
+
+    def LogRead(self, plan):
+        """
+        Read the tags of a ReadPlan and log them
+        """
+        self.Log(time.time(), plan.Read())
+
+    def Flush(self):
+        """
+        Write the buffered samples to the file
+        """
+        self._acquire()
+        try:
+            self._flush()
+        finally:
+            self._release()
+
+    def Close(self):
+        """
+        Write the buffered samples, sync and close the file
+        """
+        self._acquire()
+        try:
+            self._flush()
+            if self._file is not None:
+                self._fsync()
+                self._file.close()
+                self._file = None
+        finally:
+            self._release()
+
+    def _flush(self):
+
+        self._last_flush = monotonic()
+        if not self._buffer or self._file is None:
+            return
+
+        data = b''.join(self._buffer)
+        self._buffer = []
+        if self._size and self._size + len(data) > self.MaxBytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+        if self.FsyncInterval is not None and monotonic() - self._last_fsync >= self.FsyncInterval:
+            self._fsync()
+
+    def _fsync(self):
+
+        self._last_fsync = monotonic()
+        if self.FsyncInterval is not None and hasattr(os, 'fsync'):
+            os.fsync(self._file.fileno())
+
+    def _open(self):
+        """
+        Start a new file with the header, an existing file is rotated
+        """
+        try:
+            exists = os.stat(self.Path)[6] > 0
+        except OSError:
+            exists = False
+        if exists:
+            self._rotate_files()
+
+        self._file = open(self.Path, 'wb')
+        self._file.write(self._header)
+        self._size = len(self._header)
+
+    def _rotate(self):
+
+        self._fsync()
+        self._file.close()
+        self._file = None
+        self._open()
+
+    def _rotate_files(self):
+        """
+        path.n-1 to path.n ... path to path.1
+        """
+        if self.BackupCount < 1:
+            _remove(self.Path)
+            return
+
+        _remove('{}.{}'.format(self.Path, self.BackupCount))
+        for i in range(self.BackupCount - 1, -1, -1):
+            source = '{}.{}'.format(self.Path, i) if i else self.Path
+            try:
+                os.rename(source, '{}.{}'.format(self.Path, i + 1))
+            except OSError:
+                pass
+
+    def _acquire(self):
+
+        if self._lock is not None:
+            self._lock.acquire()
+
+    def _release(self):
+
+        if self._lock is not None:
+            self._lock.release()
+
+
+class CSVLogger(_FileLogger):
+    """
+    Log samples to a CSV file, one row per sample.  The first column is
+    the timestamp (seconds since the epoch), then a column per tag.
+    Tags that failed to read are left empty.  See _FileLogger for the
+    buffering, rotation and fsync options
+    """
+
+    def _make_header(self, responses):
+
+        return _csv_row(['Timestamp'] + [r.TagName for r in responses])
+
+    def _make_record(self, timestamp, responses):
+
+        return _csv_row(['{:.3f}'.format(timestamp)] + [r.Value if r.Status == 'Success' else None
+                                                        for r in responses])
+
+
+class BinaryLogger(_FileLogger):
+    """
+    Log samples to a compact binary file of fixed size records.  The
+    header holds the schema, the tag names and their data types, taken
+    from the PLC KnownTags.  Each record is the timestamp (double), a
+    bit per tag that is set when the read succeeded, then each value.
+    Atomic types are stored as their CIP type, strings as 82 bytes,
+    other structures and arrays (reads of more than one element)
+    can't be logged.
+    Use read_binary_log to read the file back.  See _FileLogger for the
+    buffering, rotation and fsync options
+    """
+
+    def __init__(self, path, plc, max_bytes=10485760, backup_count=5, buffer_size=1000, flush_interval=1.0,
+                 fsync_interval=None):
+
+        super(BinaryLogger, self).__init__(path, max_bytes, backup_count, buffer_size, flush_interval,
+                                           fsync_interval)
+        self.PLC = plc
+        self._format = None
+        self._types = None
+
+    def _make_header(self, responses):
+
+        self._types = [self._data_type(r) for r in responses]
+        self._format = _record_format(self._types)
+
+        header = pack('<4sBH', _MAGIC, _VERSION, len(responses))
+        for response, data_type in zip(responses, self._types):
+            name = response.TagName.encode('utf-8')
+            header += pack('<BH', data_type, len(name)) + name
+        return header
+
+    def _make_record(self, timestamp, responses):
+
+        valid = 0
+        values = []
+        for i, (response, data_type) in enumerate(zip(responses, self._types)):
+            value = response.Value
+            if isinstance(value, list):
+                raise ValueError('{} is an array, arrays can not be logged in the binary format'.format(
+                    response.TagName))
+            if response.Status == 'Success' and value is not None:
+                valid |= 1 << i
+            else:
+                value = _EMPTY.get(data_type, 0)
+            if data_type == 0xda:
+                value = value.encode('utf-8')
+            values.append(value)
+
+        mask = [(valid >> (8 * i)) & 0xff for i in range((len(values) + 7) // 8)]
+        return pack(self._format, timestamp, *(mask + values))
+
+    def _data_type(self, response):
+        """
+        Data type of a tag from KnownTags, bits are BOOL,
+        structures are only logged when they are strings
+        """
+        tag_name = response.TagName
+        if isinstance(response.Value, list):
+            raise ValueError('{} is an array, arrays can not be logged in the binary format'.format(tag_name))
+        tag, base_tag, index = parse_tag_name(tag_name)
+        if base_tag not in self.PLC.KnownTags:
+            raise ValueError('The data type of {} is unknown, {}'.format(tag_name, response.Status))
+        data_type = self.PLC.KnownTags[base_tag][0]
+        if bit_of_word(tag_name) or data_type == 0xd3:
+            return 0xc1
+        if data_type == 0xa0 and isinstance(response.Value, str):
+            return 0xda
+        if data_type not in _FORMATS:
+            raise ValueError('{} can not be logged in the binary format'.format(tag_name))
+        return data_type
+
+
+def read_binary_log(path):
+    """
+    Read a file written by BinaryLogger, returns the tag names and
+    a list of (timestamp, values) records.  Values of tags that
+    failed to read are None
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, version, count = unpack_from('<4sBH', data, 0)
+    if magic != _MAGIC:
+        raise ValueError('{} is not a binary log'.format(path))
+
+    offset = calcsize('<4sBH')
+    names = []
+    types = []
+    for _ in range(count):
+        data_type, length = unpack_from('<BH', data, offset)
+        offset += 3
+        names.append(data[offset:offset + length].decode('utf-8'))
+        types.append(data_type)
+        offset += length
+
+    fmt = _record_format(types)
+    size = calcsize(fmt)
+    masks = (count + 7) // 8
+    records = []
+    while offset + size <= len(data):
+        fields = unpack_from(fmt, data, offset)
+        offset += size
+        valid = 0
+        for i in range(masks):
+            valid |= fields[1 + i] << (8 * i)
+        values = []
+        for i, value in enumerate(fields[1 + masks:]):
+            if not valid & (1 << i):
+                value = None
+            elif types[i] == 0xda:
+                value = value.rstrip(b'\x00').decode('utf-8')
+            values.append(value)
+        records.append((fields[0], values))
+
+    return names, records
+
+
+def _record_format(types):
+    """
+    struct format of a record: timestamp, valid bits, values
+    """
+    return '<d{}B{}'.format((len(types) + 7) // 8, ''.join(_FORMATS[t] for t in types))
+
+
+def _csv_row(values):
+    """
+    One CSV line, quoting the values that need it
+    """
+    fields = []
+    for value in values:
+        if value is None:
+            value = ''
+        elif isinstance(value, float):
+            value = repr(value)
+        else:
+            value = str(value)
+            if ',' in value or '"' in value or '\n' in value:
+                value = '"{}"'.format(value.replace('"', '""'))
+        fields.append(value)
+    return (','.join(fields) + '\n').encode('utf-8')
+
+
+def _remove(path):
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_MAGIC = b'PLXL'
+_VERSION = 1
+
+# struct format of each data type, strings are 82 bytes like STRING
+_FORMATS = dict((key, value[2][1:]) for key, value in cip_data_types.items()
+                if key not in (0x00, 0xa0, 0xd0, 0xda, 0xd2))
+_FORMATS[0xd2] = 'H'
+_FORMATS[0xda] = '82s'
+_EMPTY = {0xda: '', 0xc1: False}
@@ -0,0 +1,170 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from .lgx_response import Response
+
+
+class ReadPlan(object):
+    """
+    Tags compiled into multi-service read requests once, so reading
+    the same tags over and over doesn't build the requests every time.
+
+    Tags are the tag names, or tuples like a list Read takes:
+    (tag, count) or (tag, count, datatype).  Single elements are packed
+    into the multi-service requests, array reads (count > 1) and all
+    reads on the Micro800 are read on their own.
+
+    The requests are compiled on the first Read, after the data types
+    are known, and again whenever the connection size changes.
+
+    ReadChanges only returns the tags that changed since the last read,
+    the raw reply of each request, then of each tag, is compared with
+    the last one, so the tags that didn't change aren't decoded.
+    """
+
+    def __init__(self, plc, tags):
+
+        self.PLC = plc
+        self.Tags = []
+        for tag in tags:
+            if isinstance(tag, (list, tuple)):
+                tag = list(tag) + [1, None][len(tag) - 1:]
+                self.Tags.append(tag[:3])
+            else:
+                self.Tags.append([tag, 1, None])
+        self.TagNames = [t[0] for t in self.Tags]
+
+        self._requests = None
+        self._single = None
+        self._connection_size = None
+        self._replies = []
+        self._segments = [None] * len(self.Tags)
+
+    def __len__(self):
+
+        return len(self.Tags)
+
+    def __repr__(self):
+
+        return 'ReadPlan(Tags={}, Requests={})'.format(len(self.Tags), len(self._requests or []))
+
+    def Read(self):
+        """
+        Read all the tags, returns a list of Response in the order of the tags
+        """
+        values = [None] * len(self.Tags)
+        for i, segment, status in self._read_segments():
+            values[i] = self._decode(i, segment, status)
+        return values
+
+    def ReadChanges(self):
+        """
+        Read all the tags, returns a list of Response of only the tags
+        whose value or status changed since the last read.  The first
+        read returns all of them
+        """
+        return [response for _, response in self._changes()]
+
+    def Compile(self):
+        """
+        Compile the read requests, done by the first Read.  Call
+        again after the tags were changed in the PLC (download)
+        """
+        plc = self.PLC
+        plc._get_unknown_types(self.Tags)
+
+        self._single = []
+        packed = []
+        for i, tag in enumerate(self.Tags):
+            if tag[1] > 1 or plc.Micro800:
+                self._single.append(i)
+            else:
+                packed.append(i)
+
+        self._requests = []
+        start = 0
+        for request, request_tags in plc._compile_read_requests([self.Tags[i] for i in packed]):
+            self._requests.append((request, packed[start:start + len(request_tags)]))
+            start += len(request_tags)
+        self._connection_size = plc.ConnectionSize
+        self._replies = [None] * len(self._requests)
+        self._segments = [None] * len(self.Tags)
+
+    def _changes(self):
+        """
+        Yields (index, Response) of the tags that changed
+        """
+        for i, segment, status in self._read_segments(True):
+            if isinstance(segment, Response):
+                # read on their own, compare the values
+                last = (segment.Value, segment.Status)
+            elif segment is None:
+                last = status
+            else:
+                last = segment
+
+            if last != self._segments[i]:
+                self._segments[i] = last
+                yield i, self._decode(i, segment, status)
+
+    def _read_segments(self, skip_unchanged=False):
+        """
+        Send the requests, yields (index, segment, status) for each tag.
+        Packed tags yield the raw reply of their service, tags read on
+        their own yield their Response.  With skip_unchanged, the tags of
+        requests whose reply didn't change since the last time are skipped
+        """
+        plc = self.PLC
+        conn = plc.conn.connect()
+        if not conn[0]:
+            self._replies = [None] * len(self._replies)
+            for i in range(len(self.Tags)):
+                yield i, None, conn[1]
+            return
+
+        if self._requests is None or self._connection_size != plc.ConnectionSize:
+            self.Compile()
+
+        replies = plc._send_requests([request for request, _ in self._requests])
+        for j, ((_, indexes), (status, ret_data)) in enumerate(zip(self._requests, replies)):
+            if not ret_data:
+                self._replies[j] = None
+                for i in indexes:
+                    yield i, None, status
+                continue
+
+            # the reply past the encapsulation header, which has the sequence count
+            reply = ret_data[50:]
+            if skip_unchanged and reply == self._replies[j]:
+                continue
+            self._replies[j] = reply
+            for i, segment in zip(indexes, plc._split_multi_service_reply(ret_data)):
+                yield i, segment, 0
+
+        for i in self._single:
+            yield i, plc._read_tag(*self.Tags[i]), 0
+
+    def _decode(self, index, segment, status):
+        """
+        Response of a tag from what _read_segments yielded
+        """
+        if isinstance(segment, Response):
+            return segment
+        if segment is None:
+            return Response(self.TagNames[index], None, status)
+
+        tag_name, value, status = self.PLC._parse_read_segment(segment, self.Tags[index])
+        return Response(tag_name, value, status)
@@ -20,11 +20,25 @@ from pylogix.utils import is_python3, is_micropython, is_python2
 
 
 class Response(object):
+    __slots__ = ('TagName', 'Value', '_status')
 
     def __init__(self, tag_name, value, status):
         self.TagName = tag_name
         self.Value = value
-        self.Status = self.get_error_code(status)
+        self._status = status
+
+    @property
+    def Status(self):
+        """
+        The status string is only looked up the first
+        time it is asked for
+        """
+        self._status = self.get_error_code(self._status)
+        return self._status
+
+    @Status.setter
+    def Status(self, status):
+        self._status = status
 
     def __repr__(self):
 
@@ -0,0 +1,196 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from struct import unpack_from
+
+from .eip import parse_tag_name
+from .lgx_response import Response
+
+
+class RingFollower(object):
+    """
+    Follows a circular buffer in the PLC, an array of size elements
+    and a head tag, the index of the next element the PLC writes.
+    Each Read returns the elements written since the last Read, in
+    the order they were written, the first Read only finds the head.
+
+    The head is read in the same packet as the elements that are
+    expected to be new (as many as last time), the ones that didn't
+    fit are read after, with at most one read on each side of the wrap.
+    If the PLC writes more than size elements between two reads, the
+    elements that were overwritten are lost.  With counter=True, the
+    head tag is a count of the elements written that keeps increasing,
+    so the follower can tell when the PLC lapped it.  The first Read
+    takes the count modulo size as the head, after that the head moves
+    by how much the count did, so the count can wrap around.  The Read then returns the size
+    elements still in the buffer with an overrun status, the lost
+    elements are counted in Lost.
+
+    Elements of structures (other than strings) are returned as bytes,
+    BOOL arrays aren't supported.
+    """
+
+    def __init__(self, plc, buffer_tag, head_tag, size, counter=False):
+
+        self.PLC = plc
+        self.BufferTag = buffer_tag
+        self.HeadTag = head_tag
+        self.Size = size
+        self.Counter = counter
+        self.Position = None
+        self.Lost = 0
+
+        self._count = None
+        self._expected = 1
+        self._element_size = None
+        self._head_service = None
+        self._head_size = None
+
+    def __repr__(self):
+
+        return 'RingFollower(BufferTag={}, HeadTag={}, Size={}, Position={})'.format(
+            self.BufferTag, self.HeadTag, self.Size, self.Position)
+
+    def Read(self):
+        """
+        Read the new elements, returns a Response with the list of them
+        """
+        plc = self.PLC
+        conn = plc.conn.connect()
+        if not conn[0]:
+            return Response(self.BufferTag, None, conn[1])
+
+        if self._element_size is None:
+            self._compile()
+
+        position = self.Position
+        if position is None or plc.Micro800:
+            head, values, status = self._read_head(), [], 0
+        else:
+            head, values, status = self._read_head_and_expected(position)
+        if head.Status != 'Success':
+            return Response(self.BufferTag, None, head.Status)
+        if not isinstance(head.Value, int) or not (self.Counter or 0 <= head.Value < self.Size):
+            return Response(self.BufferTag, None, 'Head {} is out of range'.format(head.Value))
+
+        count, last = head.Value % (1 << (8 * self._head_size)), self._count
+        self._count = count
+        if position is None:
+            self.Position = count % self.Size if self.Counter else count
+            return Response(self.BufferTag, [], 0)
+
+        if self.Counter:
+            # from the last position, rather than count modulo size,
+            # which jumps when the counter wraps around
+            new = (count - last) % (1 << (8 * self._head_size))
+            self.Position = (position + new) % self.Size
+        else:
+            self.Position = count
+            new = (count - position) % self.Size
+        if new > self.Size:
+            # lapped, the oldest element left is the one at the head
+            lost = new - self.Size
+            self.Lost += lost
+            status = 'Overrun, {} elements lost'.format(lost)
+            position, values, new = self.Position, [], self.Size
+        values = values[:new]
+        # the elements that weren't in the packet with the head
+        start = (position + len(values)) % self.Size
+        remaining = new - len(values)
+        while remaining > 0:
+            count = min(remaining, self.Size - start)
+            response = plc._read_tag('{}[{}]'.format(self.BufferTag, start), count)
+            if response.Status != 'Success':
+                # read them again next time
+                self.Position = start
+                self._count = (self._count - remaining) % (1 << (8 * self._head_size))
+                status = response.Status
+                break
+            values.extend(self._as_list(response.Value))
+            start = (start + count) % self.Size
+            remaining -= count
+
+        self._expected = max(1, len(values))
+        return Response(self.BufferTag, values, status)
+
+    def _compile(self):
+        """
+        Get the data types and the size of an element
+        """
+        plc = self.PLC
+        plc._get_unknown_types([[self.HeadTag, 1, None], ['{}[0]'.format(self.BufferTag), 1, None]])
+
+        tag, base_tag, index = parse_tag_name(self.BufferTag)
+        data_type, data_len = plc.KnownTags[base_tag]
+        if data_type == 0xd3:
+            raise ValueError('BOOL arrays are not supported')
+        if data_type == 0xa0:
+            layout = plc._string_layout(plc._struct_handles.get(base_tag))
+            self._element_size = layout[3] if layout is not None else data_len
+        else:
+            self._element_size = plc.CIPTypes[data_type][0]
+
+        tag, base_tag, index = parse_tag_name(self.HeadTag)
+        data_type = plc.KnownTags[base_tag][0]
+        self._head_service = plc._add_read_service(plc._build_ioi(self.HeadTag, data_type), 1)
+        self._head_size = plc.CIPTypes[data_type][0]
+
+    def _read_head(self):
+
+        return self.PLC._read_tag(self.HeadTag)
+
+    def _read_head_and_expected(self, position):
+        """
+        Read the head and the elements expected to be new in
+        one packet, returns the head Response and the elements
+        """
+        plc = self.PLC
+        # the reply has the multiple service header, the head and the elements
+        room = plc.ConnectionSize - 28 - 4 - (6 + self._head_size) - 8
+        count = min(self._expected + self._expected // 4 + 1, room // self._element_size, self.Size - position)
+        if count < 1:
+            return self._read_head(), [], 0
+
+        tag_name = '{}[{}]'.format(self.BufferTag, position)
+        tag, base_tag, index = parse_tag_name(self.BufferTag)
+        data_type = plc.KnownTags[base_tag][0]
+        service = plc._add_read_service(plc._build_ioi(tag_name, data_type), count)
+
+        status, ret_data = plc.conn.send(plc._build_multi_service([self._head_service, service]))
+        if not ret_data:
+            return Response(self.HeadTag, None, status), [], status
+
+        head_segment, segment = plc._split_multi_service_reply(ret_data)
+        head = Response(*plc._parse_read_segment(head_segment, [self.HeadTag, 1, None]))
+        values = []
+        if unpack_from('<B', segment, 2)[0] in (0, 6):
+            values = self._as_list(plc._get_values(self.BufferTag, segment[4:]))
+        return head, values, 0
+
+    def _as_list(self, values):
+        """
+        The elements as a list, structures are split into
+        the bytes of each element
+        """
+        if isinstance(values, (bytes, bytearray)):
+            values = [values]
+        elif not isinstance(values, list):
+            return [values]
+        if len(values) == 1 and isinstance(values[0], (bytes, bytearray)):
+            data = values[0]
+            size = self._element_size
+            return [data[i:i + size] for i in range(0, len(data) - size + 1, size)]
+        return values
@@ -0,0 +1,252 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import time
+
+from .lgx_response import Response
+from .utils import monotonic
+
+try:
+    import threading
+except ImportError:
+    # micropython
+    threading = None
+
+
+class SQLSink(object):
+    """
+    Insert tag values into a database table through any DB-API
+    connection (sqlite3, mysql.connector, psycopg2...), a row per
+    Response: timestamp, tag name, value and status.
+
+    Rows are buffered and inserted with one executemany and one commit
+    every max_rows rows or flush_interval seconds.  When the insert
+    fails, the rows are kept in a retry queue and inserted with the
+    next batch.  The queue holds up to max_retry_rows rows, the oldest
+    rows are dropped past that (counted in Dropped).
+
+    When the database rejects the data (IntegrityError, DataError ...)
+    rather than being unavailable, the batch is split in halves until
+    the rows that fail on their own are found, the other rows are
+    inserted and the bad ones dropped (counted in Rejected).
+
+    The placeholders of the insert depend on the driver, paramstyle is
+    the paramstyle of its module, qmark (sqlite3), format (mysql) ...
+    """
+
+    def __init__(self, connection, table='tag_values', columns=('Timestamp', 'TagName', 'Value', 'Status'),
+                 max_rows=1000, flush_interval=1.0, max_retry_rows=100000, paramstyle='qmark'):
+
+        self.Connection = connection
+        self.Table = table
+        self.Columns = columns
+        self.MaxRows = max_rows
+        self.FlushInterval = flush_interval
+        self.MaxRetryRows = max_retry_rows
+        self.Dropped = 0
+        self.Inserted = 0
+        self.Rejected = 0
+        self.LastError = None
+
+        self._insert = 'INSERT INTO {} ({}) VALUES ({})'.format(table, ', '.join(columns),
+                                                               _placeholders(paramstyle, len(columns)))
+        self._rows = []
+        self._retry = []
+        self._last_flush = monotonic()
+        self._lock = threading.Lock() if threading else None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.Close()
+
+    def __len__(self):
+
+        return len(self._rows) + len(self._retry)
+
+    def Add(self, responses, timestamp=None):
+        """
+        Add a Response, or a list of them, read at timestamp (now by
+        default).  Can be used as the Subscribe callback
+        """
+        if isinstance(responses, Response):
+            responses = [responses]
+        if timestamp is None:
+            timestamp = time.time()
+
+        self._acquire()
+        try:
+            self._rows.extend((timestamp, r.TagName, _value(r.Value), r.Status) for r in responses)
+            if len(self._rows) >= self.MaxRows or monotonic() - self._last_flush >= self.FlushInterval:
+                self._flush()
+        finally:
+            self._release()
+
+    def Log(self, timestamp, responses):
+        """
+        Add a sample, can be used as the Sample callback
+        """
+        self.Add(responses, timestamp)
+
+    def Flush(self):
+        """
+        Insert the buffered rows, returns True when they were committed
+        """
+        self._acquire()
+        try:
+            return self._flush()
+        finally:
+            self._release()
+
+    def Close(self):
+        """
+        Insert the buffered rows, the connection is left open
+        """
+        self.Flush()
+
+    def _flush(self):
+
+        self._last_flush = monotonic()
+        rows = self._retry + self._rows
+        self._rows = []
+        self._retry = []
+        if not rows:
+            return True
+
+        try:
+            self._insert_rows(rows)
+        except Exception as e:
+            self.LastError = e
+            if _rejected(e):
+                self._keep(self._isolate(rows))
+            else:
+                self._keep(rows)
+            return False
+
+        self.Inserted += len(rows)
+        return True
+
+    def _insert_rows(self, rows):
+        """
+        Insert the rows in one transaction, rolled back when it fails
+        """
+        try:
+            cursor = self.Connection.cursor()
+            try:
+                cursor.executemany(self._insert, rows)
+            finally:
+                cursor.close()
+            self.Connection.commit()
+        except Exception:
+            try:
+                self.Connection.rollback()
+            except Exception:
+                pass
+            raise
+
+    def _isolate(self, rows):
+        """
+        Insert the rows of a batch the database rejected in halves, until
+        the rows that fail on their own are found.  Returns the rows to
+        retry, when the database becomes unavailable or no row at all
+        could be inserted (the table is wrong rather than the rows)
+        """
+        parts = [rows[len(rows) // 2:], rows[:len(rows) // 2]]
+        bad = []
+        retry = []
+        inserted = 0
+        while parts:
+            part = parts.pop()
+            if not part:
+                continue
+            try:
+                self._insert_rows(part)
+                inserted += len(part)
+            except Exception as e:
+                self.LastError = e
+                if not _rejected(e):
+                    retry = part + [row for p in reversed(parts) for row in p]
+                    break
+                if len(part) == 1:
+                    bad.extend(part)
+                else:
+                    parts.append(part[len(part) // 2:])
+                    parts.append(part[:len(part) // 2])
+
+        if not inserted:
+            return bad + retry
+        self.Inserted += inserted
+        self.Rejected += len(bad)
+        return retry
+
+    def _keep(self, rows):
+        """
+        Keep the rows for the next flush, up to MaxRetryRows
+        """
+        if len(rows) > self.MaxRetryRows:
+            self.Dropped += len(rows) - self.MaxRetryRows
+            rows = rows[len(rows) - self.MaxRetryRows:]
+        self._retry = rows
+
+    def _acquire(self):
+
+        if self._lock is not None:
+            self._lock.acquire()
+
+    def _release(self):
+
+        if self._lock is not None:
+            self._lock.release()
+
+
+def _placeholders(paramstyle, count):
+    """
+    The insert placeholders for the paramstyle of the driver
+    """
+    if paramstyle == 'qmark':
+        return ', '.join(['?'] * count)
+    if paramstyle in ('format', 'pyformat'):
+        return ', '.join(['%s'] * count)
+    if paramstyle == 'numeric':
+        return ', '.join(':{}'.format(i + 1) for i in range(count))
+    raise ValueError('Unsupported paramstyle {}'.format(paramstyle))
+
+
+def _rejected(error):
+    """
+    True when the database rejected the data, rather than being
+    unavailable, from the DB-API exception (or a binding error)
+    """
+    names = [cls.__name__ for cls in getattr(type(error), '__mro__', (type(error),))]
+    return any(name in _REJECTED for name in names)
+
+
+def _value(value):
+    """
+    Arrays are stored as their text
+    """
+    if isinstance(value, (list, tuple, dict)):
+        return str(value)
+    return value
+
+
+# DB-API exceptions raised for the data of a row, the
+# parameters that can't be bound raise the python ones
+_REJECTED = ('IntegrityError', 'DataError', 'ProgrammingError', 'InterfaceError', 'NotSupportedError',
+             'TypeError', 'ValueError', 'OverflowError')
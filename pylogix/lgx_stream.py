@@ -0,0 +1,181 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import time
+
+from .lgx_subscribe import Scheduler
+
+try:
+    import threading
+except ImportError:
+    # micropython
+    threading = None
+
+
+class Stream(object):
+    """
+    Tags sampled every interval (seconds) with PLC.Sample, iterating
+    the stream yields (timestamp, [Response...]) for each sample, with
+    a for loop or an async for loop.
+
+    Samples wait in a queue of up to max_size samples until they are
+    taken.  When the queue is full, the oldest sample is dropped, or
+    with overflow='newest', the new sample is, counted in Dropped.
+    With overflow='block', sampling waits for the consumer instead,
+    the deadlines missed meanwhile are skipped by the Sampler.  Since
+    the PLC Scheduler thread is shared with the other Samplers, a
+    blocking stream samples in a Scheduler (and thread) of its own,
+    don't use it on a PLC instance that has other subscriptions.
+
+    Without threading (micropython), the samples are read as the stream
+    is iterated.
+    """
+
+    def __init__(self, plc, tags, interval, max_size=100, overflow='oldest'):
+
+        if overflow not in ('oldest', 'newest', 'block'):
+            raise ValueError('Unknown overflow {}'.format(overflow))
+
+        self.PLC = plc
+        self.Tags = tags
+        self.Interval = interval
+        self.MaxSize = max_size
+        self.Overflow = overflow
+        self.Dropped = 0
+
+        self._queue = []
+        self._closed = False
+        self._cond = threading.Condition() if threading else None
+        if overflow == 'block':
+            self._scheduler = Scheduler(plc)
+            self.Sampler = self._scheduler.Sample(tags, interval * 1000.0, self._put)
+            self._scheduler.Start()
+        else:
+            self._scheduler = None
+            self.Sampler = plc.Sample(tags, interval * 1000.0, self._put)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.Close()
+
+    def __len__(self):
+
+        return len(self._queue)
+
+    def __iter__(self):
+
+        return self
+
+    def __next__(self):
+
+        if self._cond is None:
+            # no background thread, sample until there is one
+            while not self._queue and not self._closed:
+                delay = self.Sampler.Scheduler.Poll()
+                if not self._queue:
+                    time.sleep(delay)
+            if not self._queue:
+                raise StopIteration
+            return self._queue.pop(0)
+
+        self._cond.acquire()
+        try:
+            while not self._queue and not self._closed:
+                self._cond.wait(1.0)
+            if not self._queue:
+                raise StopIteration
+            sample = self._queue.pop(0)
+            # wake a blocked sampler
+            self._cond.notify_all()
+            return sample
+        finally:
+            self._cond.release()
+
+    # python 2
+    next = __next__
+
+    def __aiter__(self):
+
+        return self
+
+    def __anext__(self):
+        """
+        Wait for the next sample in an executor thread,
+        so the event loop isn't blocked
+        """
+        import asyncio
+        loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        return loop.run_in_executor(None, self._next_async)
+
+    def Close(self):
+        """
+        Stop sampling, the samples already
+        queued can still be iterated
+        """
+        if self._cond is None:
+            self._closed = True
+        else:
+            self._cond.acquire()
+            try:
+                self._closed = True
+                self._cond.notify_all()
+            finally:
+                self._cond.release()
+
+        self.Sampler.Cancel()
+        if self._scheduler is not None:
+            self._scheduler.Stop()
+
+    def _next_async(self):
+
+        try:
+            return self.__next__()
+        except StopIteration:
+            # a future can't raise StopIteration
+            raise StopAsyncIteration
+
+    def _put(self, timestamp, responses):
+        """
+        Sampler callback, queue the sample
+        """
+        if self._cond is None:
+            self._queue_sample(timestamp, responses)
+            return
+
+        self._cond.acquire()
+        try:
+            while self.Overflow == 'block' and len(self._queue) >= self.MaxSize and not self._closed:
+                self._cond.wait(1.0)
+            self._queue_sample(timestamp, responses)
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def _queue_sample(self, timestamp, responses):
+        """
+        Queue the sample, dropping the oldest
+        or this one when the queue is full
+        """
+        if len(self._queue) >= self.MaxSize and self.Overflow != 'block':
+            self.Dropped += 1
+            if self.Overflow == 'newest':
+                return
+            self._queue.pop(0)
+        self._queue.append((timestamp, responses))
@@ -0,0 +1,427 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import time
+
+from .lgx_plan import ReadPlan
+from .utils import monotonic
+
+try:
+    import threading
+except ImportError:
+    # micropython
+    threading = None
+
+
+class Subscription(object):
+    """
+    Tags read every Rate milliseconds by a Scheduler.  Callback is
+    called with the Response of each tag whose value (or status)
+    changed since it was last reported.  Numeric values only count
+    as changed once they move more than Deadband from the value that
+    was last reported.
+    """
+
+    def __init__(self, scheduler, tags, rate, callback, deadband=None):
+
+        self.Scheduler = scheduler
+        self.Tags = list(tags)
+        self.Rate = rate
+        self.Callback = callback
+        self.Deadband = deadband
+        self._last = {}
+
+    def __repr__(self):
+
+        return 'Subscription(Tags={}, Rate={}, Deadband={})'.format(len(self.Tags), self.Rate, self.Deadband)
+
+    def Cancel(self):
+        """
+        Stop reading the tags of the subscription
+        """
+        self.Scheduler.Unsubscribe(self)
+
+    def _update(self, key, response):
+        """
+        Call the callback when the response is a change
+        """
+        last = self._last.get(key)
+        if last is not None and not self._changed(last, response):
+            return
+        self._last[key] = response
+        try:
+            self.Callback(response)
+        except Exception as e:
+            # keep the other subscriptions running
+            print('Subscription callback failed', e)
+
+    def _changed(self, last, response):
+
+        if last.Status != response.Status:
+            return True
+
+        value = response.Value
+        if self.Deadband and not isinstance(value, bool) and last.Value is not None and value is not None:
+            try:
+                return abs(value - last.Value) > self.Deadband
+            except TypeError:
+                pass
+        return value != last.Value
+
+
+class Sampler(Subscription):
+    """
+    Tags read every Rate milliseconds by a Scheduler, Callback is called
+    every sample with the timestamp and the Response of each tag, whether
+    they changed or not.  The timestamp is the sample time on the clock,
+    samples are taken on multiples of the rate (every 100ms on the tick)
+    """
+
+    def __repr__(self):
+
+        return 'Sampler(Tags={}, Rate={})'.format(len(self.Tags), self.Rate)
+
+    def _sample(self, timestamp, responses):
+
+        try:
+            self.Callback(timestamp, [responses[_key(tag)] for tag in self.Tags])
+        except Exception as e:
+            # keep the other subscriptions running
+            print('Sampler callback failed', e)
+
+
+class RateStats(object):
+    """
+    Timing of the samples of a rate group.  Jitter is how late a sample
+    started compared to its deadline, in milliseconds.  An overrun is a
+    sample that ended after the next deadline, the deadlines that were
+    missed are skipped rather than sampled late (Skipped).  AchievedRate
+    is the samples per second since the first sample.  Errors counts the
+    samples that raised an exception, LastError is the last of them.
+    """
+    __slots__ = ('Rate', 'Samples', 'Overruns', 'Skipped', 'Errors', 'LastError', 'Jitter', 'MaxJitter',
+                 'MeanJitter', 'AchievedRate', '_start', '_total_jitter')
+
+    def __init__(self, rate):
+
+        self.Rate = rate
+        self.Samples = 0
+        self.Overruns = 0
+        self.Skipped = 0
+        self.Errors = 0
+        self.LastError = None
+        self.Jitter = 0.0
+        self.MaxJitter = 0.0
+        self.MeanJitter = 0.0
+        self.AchievedRate = 0.0
+        self._start = None
+        self._total_jitter = 0.0
+
+    def __repr__(self):
+
+        return 'RateStats(Rate={}, Samples={}, Overruns={}, Skipped={}, Errors={}, MeanJitter={:.3f}, ' \
+               'MaxJitter={:.3f}, AchievedRate={:.3f})'.format(self.Rate, self.Samples, self.Overruns, self.Skipped,
+                                                               self.Errors, self.MeanJitter, self.MaxJitter,
+                                                               self.AchievedRate)
+
+    def _add(self, deadline, started):
+
+        if self._start is None:
+            self._start = started
+        self.Samples += 1
+        self.Jitter = (started - deadline) * 1000.0
+        self.MaxJitter = max(self.MaxJitter, self.Jitter)
+        self._total_jitter += self.Jitter
+        self.MeanJitter = self._total_jitter / self.Samples
+        if started > self._start:
+            self.AchievedRate = (self.Samples - 1) / (started - self._start)
+
+
+class _RateGroup(object):
+    """
+    The subscriptions with the same rate, their tags are read together
+    with one ReadPlan, tags in more than one subscription are read once
+    """
+
+    def __init__(self, rate):
+
+        self.Rate = rate
+        self.Subscriptions = []
+        self.Stats = RateStats(rate)
+        self._plan = None
+        self._keys = []
+        self._responses = {}
+
+        # samples are aligned to the clock, the deadlines are counted
+        # from the first one so that they don't drift
+        self._period = rate / 1000.0
+        now = time.time()
+        first = (now // self._period + 1) * self._period
+        self._first_time = first
+        self._first_due = monotonic() + first - now
+        self._tick = 0
+        self.Due = self._first_due
+
+    def Sample(self, plc):
+        """
+        Take the sample that is due, then move to the next deadline,
+        skipping the ones that were missed
+        """
+        started = monotonic()
+        try:
+            self.Poll(plc, self._first_time + self._tick * self._period)
+        except Exception as e:
+            # keep the scheduler running, the error is in the stats
+            self.Stats.Errors += 1
+            self.Stats.LastError = e
+        ended = monotonic()
+        self.Stats._add(self.Due, started)
+
+        self._tick += 1
+        self.Due = self._first_due + self._tick * self._period
+        if ended > self.Due:
+            # overrun, don't pile up samples
+            missed = int((ended - self.Due) / self._period) + 1
+            self.Stats.Overruns += 1
+            self.Stats.Skipped += missed
+            self._tick += missed
+            self.Due = self._first_due + self._tick * self._period
+
+    def Poll(self, plc, timestamp=None):
+        """
+        Read the tags, the subscriptions get the tags that changed,
+        samplers get all of them
+        """
+        if self._plan is None:
+            self._compile(plc)
+        # subscribing from another thread replaces the plan
+        plan, keys = self._plan, self._keys
+
+        # only the tags that changed since the last poll are decoded
+        changed = {}
+        for i, response in plan._changes():
+            changed[keys[i]] = response
+
+        self._responses.update(changed)
+        if timestamp is None:
+            timestamp = time.time()
+        for subscription in list(self.Subscriptions):
+            if isinstance(subscription, Sampler):
+                subscription._sample(timestamp, self._responses)
+                continue
+            for tag in subscription.Tags:
+                key = _key(tag)
+                if key in changed:
+                    subscription._update(key, changed[key])
+
+    def _compile(self, plc):
+        """
+        One plan with the tags of all the subscriptions
+        """
+        tags = []
+        keys = []
+        for subscription in list(self.Subscriptions):
+            for tag in subscription.Tags:
+                key = _key(tag)
+                if key not in keys:
+                    keys.append(key)
+                    tags.append(tag)
+        self._keys = keys
+        self._responses = {}
+        self._plan = ReadPlan(plc, tags)
+
+
+class Scheduler(object):
+    """
+    Reads the tags of the subscriptions to a PLC, subscriptions
+    with the same rate are grouped, so their tags are read together.
+
+    The scheduler runs in a background thread once started, the PLC
+    instance shouldn't be used by other threads while it's running.
+    Without threading (micropython), call Run or Poll instead.
+    """
+
+    def __init__(self, plc):
+
+        self.PLC = plc
+        self._groups = {}
+        self._lock = threading.Lock() if threading else None
+        self._wake = threading.Event() if threading else None
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.Stop()
+
+    def __len__(self):
+
+        return sum(len(group.Subscriptions) for group in self._groups.values())
+
+    def Subscribe(self, tags, rate_ms, callback, deadband=None):
+        """
+        Read the tags every rate_ms milliseconds, callback is called with
+        the Response of each tag that changed.  Returns the Subscription
+        """
+        if not isinstance(tags, (list, tuple)):
+            tags = [tags]
+        return self._add(Subscription(self, tags, rate_ms, callback, deadband))
+
+    def Sample(self, tags, rate_ms, callback):
+        """
+        Read the tags every rate_ms milliseconds, aligned to the clock,
+        callback is called with the timestamp and the Response of every
+        tag each sample.  Returns the Sampler
+        """
+        if not isinstance(tags, (list, tuple)):
+            tags = [tags]
+        return self._add(Sampler(self, tags, rate_ms, callback))
+
+    def Stats(self):
+        """
+        The RateStats of each rate group, by rate
+        """
+        self._acquire()
+        try:
+            return dict((rate, group.Stats) for rate, group in self._groups.items())
+        finally:
+            self._release()
+
+    def _add(self, subscription):
+        """
+        Add the subscription to the group of its rate
+        """
+        self._acquire()
+        try:
+            group = self._groups.get(subscription.Rate)
+            if group is None:
+                group = self._groups[subscription.Rate] = _RateGroup(subscription.Rate)
+            group.Subscriptions.append(subscription)
+            group._plan = None
+        finally:
+            self._release()
+
+        if self._running:
+            self._wake.set()
+        return subscription
+
+    def Unsubscribe(self, subscription):
+        """
+        Stop reading the tags of the subscription
+        """
+        self._acquire()
+        try:
+            group = self._groups.get(subscription.Rate)
+            if group is not None and subscription in group.Subscriptions:
+                group.Subscriptions.remove(subscription)
+                group._plan = None
+                if not group.Subscriptions:
+                    del self._groups[subscription.Rate]
+        finally:
+            self._release()
+
+    def Poll(self):
+        """
+        Read the groups that are due, returns the
+        seconds until the next group is due
+        """
+        self._acquire()
+        try:
+            groups = list(self._groups.values())
+        finally:
+            self._release()
+
+        for group in groups:
+            if group.Due <= monotonic():
+                group.Sample(self.PLC)
+
+        if not groups:
+            return 0.1
+        return max(min(group.Due for group in groups) - monotonic(), 0.0)
+
+    def Run(self, duration=None):
+        """
+        Poll until stopped, or for duration seconds
+        """
+        end = monotonic() + duration if duration is not None else None
+        self._running = True
+        while self._running and (end is None or monotonic() < end):
+            delay = self.Poll()
+            if end is not None:
+                delay = min(delay, max(end - monotonic(), 0.0))
+            self._sleep(delay)
+
+    def Start(self):
+        """
+        Start polling in a background thread.  Does nothing without threading
+        """
+        if threading is None or self._running:
+            return
+
+        self._running = True
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Stop(self):
+        """
+        Stop polling
+        """
+        self._running = False
+        if self._thread is not None:
+            self._wake.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+
+    def _run(self):
+
+        while self._running:
+            self._sleep(self.Poll())
+
+    def _sleep(self, delay):
+        """
+        Sleep until the next group is due, new subscriptions wake us up
+        """
+        if self._wake is not None:
+            self._wake.wait(delay)
+            self._wake.clear()
+        else:
+            time.sleep(delay)
+
+    def _acquire(self):
+
+        if self._lock is not None:
+            self._lock.acquire()
+
+    def _release(self):
+
+        if self._lock is not None:
+            self._lock.release()
+
+
+def _key(tag):
+    """
+    Tag names aren't case sensitive
+    """
+    if isinstance(tag, (list, tuple)):
+        tag = tag[0]
+    return tag.lower()
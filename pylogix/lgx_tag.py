@@ -14,10 +14,13 @@
    limitations under the License.
 """
 
+from array import array
 from struct import unpack_from
 
 
 class Tag(object):
+    __slots__ = ('TagName', 'InstanceID', 'SymbolType', 'DataTypeValue', '_data_type', 'Array', 'Struct', 'Size',
+                 'AccessRight', 'Internal', 'Meta', 'Scope0', 'Scope1', 'Bytes', 'UDT')
 
     def __init__(self):
 
@@ -25,7 +28,7 @@ class Tag(object):
         self.InstanceID = 0x00
         self.SymbolType = 0x00
         self.DataTypeValue = 0x00
-        self.DataType = ''
+        self._data_type = None
         self.Array = 0x00
         self.Struct = 0x00
         self.Size = 0x00
@@ -35,6 +38,23 @@ class Tag(object):
         self.Scope0 = None
         self.Scope1 = None
         self.Bytes = None
+        self.UDT = None
+
+    @property
+    def DataType(self):
+        """
+        Atomic type names are only looked up when asked for, UDT
+        names are set once the templates have been retrieved
+        """
+        if self._data_type is not None:
+            return self._data_type
+        if not self.Struct and self.SymbolType in cip_data_types:
+            return cip_data_types[self.SymbolType][1]
+        return ''
+
+    @DataType.setter
+    def DataType(self, data_type):
+        self._data_type = data_type
 
     def __repr__(self):
 
@@ -96,7 +116,7 @@ class Tag(object):
             t.TagName = str(program_name + '.' + name)
         else:
             t.TagName = str(name)
-        t.InstanceID = unpack_from('<H', packet, 0)[0]
+        t.InstanceID = unpack_from('<I', packet, 0)[0]
 
         val = unpack_from('<H', packet, length+6)[0]
 
@@ -113,6 +133,7 @@ class Tag(object):
 
 
 class UDT(object):
+    __slots__ = ('Type', 'Name', 'Fields', 'FieldsByName', 'Handle', 'Size')
 
     def __init__(self):
 
@@ -120,6 +141,8 @@ class UDT(object):
         self.Name = ''
         self.Fields = []
         self.FieldsByName = {}
+        self.Handle = None
+        self.Size = 0
 
     def __repr__(self):
 
@@ -127,14 +150,145 @@ class UDT(object):
         props += 'Type={} '.format(self.Type)
         props += 'Name={} '.format(self.Name)
         props += 'Fields={} '.format(self.Fields)
-        props += 'FieldsByName={}'.format(self.FieldsByName)
+        props += 'FieldsByName={} '.format(self.FieldsByName)
+        props += 'Handle={} '.format(self.Handle)
+        props += 'Size={}'.format(self.Size)
 
         return 'UDT({})'.format(props)
 
     def __str__(self):
 
-        return '{} {} {} {}'.format(
+        return '{} {} {} {} {} {}'.format(
                 self.Type,
                 self.Name,
                 self.Fields,
-                self.FieldsByName)
+                self.FieldsByName,
+                self.Handle,
+                self.Size)
+
+
+class TagTable(object):
+    """
+    Columnar tag list for very large controllers.  Rather than one Tag
+    per tag, the names, instance ID's, type values and array dimensions
+    are kept in parallel arrays.  A Tag is only created when indexing
+    or iterating the table.
+    """
+    __slots__ = ('TagNames', 'InstanceIDs', 'TypeValues', 'Dims', 'UDT')
+
+    def __init__(self):
+
+        self.TagNames = []
+        self.InstanceIDs = array('I')
+        self.TypeValues = array('H')
+        # three dimensions per tag
+        self.Dims = array('I')
+        self.UDT = {}
+
+    def __len__(self):
+
+        return len(self.TagNames)
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += len(self.TagNames)
+
+        t = Tag()
+        t.TagName = self.TagNames[index]
+        t.InstanceID = self.InstanceIDs[index]
+
+        val = self.TypeValues[index]
+        t.SymbolType = val & 0xff
+        t.DataTypeValue = val & 0xfff
+        t.Array = (val & 0x6000) >> 13
+        t.Struct = (val & 0x8000) >> 15
+        if t.Array:
+            t.Size = self.Dims[index * 3]
+        else:
+            t.Size = 0
+
+        if t.Struct and t.DataTypeValue in self.UDT:
+            t.DataType = self.UDT[t.DataTypeValue].Name
+        return t
+
+    def __iter__(self):
+
+        for i in range(len(self.TagNames)):
+            yield self[i]
+
+    def __repr__(self):
+
+        return 'TagTable(Tags={})'.format(len(self.TagNames))
+
+    def __str__(self):
+
+        return '{} tags'.format(len(self.TagNames))
+
+    def DataType(self, index):
+        """
+        Get the data type name of a tag without creating a Tag
+        """
+        val = self.TypeValues[index]
+        if val & 0x8000:
+            udt = self.UDT.get(val & 0xfff)
+            return udt.Name if udt else ''
+        if val & 0xff in cip_data_types:
+            return cip_data_types[val & 0xff][1]
+        return ''
+
+    def extend(self, table):
+        """
+        Append the tags of another table
+        """
+        self.TagNames.extend(table.TagNames)
+        self.InstanceIDs.extend(table.InstanceIDs)
+        self.TypeValues.extend(table.TypeValues)
+        self.Dims.extend(table.Dims)
+
+    def parse(self, packet, program_name):
+        """
+        Add a tag from the tag list reply to the table, the same
+        way Tag.parse does.  Returns the tag name, tags that are in
+        our filter are not added
+        """
+        length = unpack_from('<H', packet, 4)[0]
+        name = packet[6:length+6].decode('utf-8')
+        if program_name:
+            name = str(program_name + '.' + name)
+        else:
+            name = str(name)
+
+        if Tag.in_filter(name):
+            return name
+
+        self.TagNames.append(name)
+        self.InstanceIDs.append(unpack_from('<I', packet, 0)[0])
+        self.TypeValues.append(unpack_from('<H', packet, length+6)[0])
+        self.Dims.extend(unpack_from('<III', packet, length+8))
+        return name
+
+
+cip_data_types = {0x00: (1, "UNKNOWN", '<B'),
+                  0xa0: (88, "STRUCT", '<B'),
+                  0xc0: (8, "DT", '<Q'),
+                  0xc1: (1, "BOOL", '<?'),
+                  0xc2: (1, "SINT", '<b'),
+                  0xc3: (2, "INT", '<h'),
+                  0xc4: (4, "DINT", '<i'),
+                  0xc5: (8, "LINT", '<q'),
+                  0xc6: (1, "USINT", '<B'),
+                  0xc7: (2, "UINT", '<H'),
+                  0xc8: (4, "UDINT", '<I'),
+                  0xc9: (8, "LWORD", '<Q'),
+                  0xca: (4, "REAL", '<f'),
+                  0xcc: (8, "LDT", '<Q'),
+                  0xcb: (8, "LREAL", '<d'),
+                  0xd0: (1, "O_STRING", '<B'),
+                  0xd1: (1, "BYTE", "<B"),
+                  0xd2: (2, "WORD", "<I"),
+                  0xd3: (4, "DWORD", '<i'),
+                  0xd6: (4, "TIME32", '<I'),
+                  0xd7: (8, "TIME", '<Q'),
+                  0xda: (1, "STRING", '<B'),
+                  0xdf: (8, "LTIME", '<Q')}
@@ -0,0 +1,313 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import time
+
+from struct import unpack_from
+
+from .eip import bit_of_word, get_word_count, parse_tag_name
+from .lgx_response import Response
+from .utils import monotonic
+
+try:
+    import threading
+except ImportError:
+    # micropython
+    threading = None
+
+
+class TriggerCapture(object):
+    """
+    Polls a trigger tag as fast as it can and reads the payload tag
+    (count elements, a UDT array for example) as soon as the trigger
+    changes, or with edge='rising', goes from 0 (False) to non-zero.
+    callback is called with the Response of the trigger and the payload.
+
+    The payload read is built once, the first read learns how the reply
+    is fragmented, then every fragment is requested up front (pipelined)
+    rather than one after the other.  With ack, the ack tag is written
+    with ack_value (the trigger value by default) after each capture,
+    in the same packet as the next trigger poll.
+
+    Latency is the time from the trigger poll reply that had the edge
+    to the payload data, in milliseconds.
+
+    Start polls in a background thread until Stop, used as a context
+    manager, the capture is started and stopped with the with block.
+    The PLC instance shouldn't be used by other threads while it's
+    running, use a PLC instance of its own.  Without threading
+    (micropython), call Run or Poll instead.
+    """
+
+    def __init__(self, plc, trigger, payload, callback, count=1, ack=None, ack_value=None, edge='change',
+                 interval=0.0):
+
+        if edge not in ('change', 'rising'):
+            raise ValueError('Unknown edge {}'.format(edge))
+
+        self.PLC = plc
+        self.Trigger = trigger
+        self.Payload = payload
+        self.Callback = callback
+        self.Count = count
+        self.Ack = ack
+        self.AckValue = ack_value
+        self.Edge = edge
+        self.Interval = interval
+
+        self.Polls = 0
+        self.Captures = 0
+        self.Errors = 0
+        self.Latency = 0.0
+        self.MaxLatency = 0.0
+        self.MeanLatency = 0.0
+        self.AckResponse = None
+
+        self._trigger_request = None
+        self._payload_requests = None
+        self._payload_sizes = None
+        self._ack_request = None
+        self._last = None
+        self._total_latency = 0.0
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+
+        self.Start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.Stop()
+
+    def __repr__(self):
+
+        return 'TriggerCapture(Trigger={}, Payload={}, Captures={}, MeanLatency={:.3f}, MaxLatency={:.3f})'.format(
+            self.Trigger, self.Payload, self.Captures, self.MeanLatency, self.MaxLatency)
+
+    def Poll(self):
+        """
+        Poll the trigger once, capture the payload on an edge.
+        Returns True when the payload was captured
+        """
+        plc = self.PLC
+        conn = plc.conn.connect()
+        if not conn[0]:
+            self.Errors += 1
+            return False
+
+        if self._trigger_request is None:
+            self.Compile()
+
+        trigger = self._poll_trigger()
+        self.Polls += 1
+        if trigger.Status != 'Success':
+            self.Errors += 1
+            return False
+
+        last, self._last = self._last, trigger.Value
+        if last is None or trigger.Value == last:
+            return False
+        if self.Edge == 'rising' and (last or not trigger.Value):
+            return False
+
+        edge = monotonic()
+        payload = self._read_payload()
+        self.Latency = (monotonic() - edge) * 1000.0
+        self.Captures += 1
+        self.MaxLatency = max(self.MaxLatency, self.Latency)
+        self._total_latency += self.Latency
+        self.MeanLatency = self._total_latency / self.Captures
+
+        if self.Ack is not None:
+            value = trigger.Value if self.AckValue is None else self.AckValue
+            self._ack_request = plc._generate_write_service_list([(self.Ack, value)])[0][0]
+
+        try:
+            self.Callback(trigger, payload)
+        except Exception as e:
+            # keep capturing
+            print('TriggerCapture callback failed', e)
+        return True
+
+    def Compile(self):
+        """
+        Build the trigger and payload requests, done by the first Poll.
+        Call again after the tags were changed in the PLC (download)
+        """
+        plc = self.PLC
+        tags = [[self.Trigger, 1, None], [self.Payload, self.Count, None]]
+        if self.Ack is not None:
+            tags.append([self.Ack, 1, None])
+        plc._get_unknown_types(tags)
+
+        tag, base_tag, index = parse_tag_name(self.Trigger)
+        data_type = plc.KnownTags[base_tag][0]
+        self._trigger_request = plc._add_read_service(plc._build_ioi(self.Trigger, data_type), 1)
+        self._payload_requests = None
+        self._last = None
+
+    def Run(self, duration=None):
+        """
+        Poll until stopped, or for duration seconds
+        """
+        end = monotonic() + duration if duration is not None else None
+        self._running = True
+        while self._running and (end is None or monotonic() < end):
+            self.Poll()
+            if self.Interval:
+                time.sleep(self.Interval)
+
+    def Start(self):
+        """
+        Start polling in a background thread.  Does nothing without threading
+        """
+        if threading is None or self._running:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self.Run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Stop(self):
+        """
+        Stop polling, an ack that wasn't sent yet is written
+        """
+        self._running = False
+        if self._thread is not None:
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+        if self._ack_request is not None and self.PLC.conn.connect()[0]:
+            status, ret_data = self.PLC.conn.send(self._ack_request)
+            self._set_ack(status)
+
+    def _poll_trigger(self):
+        """
+        Read the trigger, with the pending ack
+        written in the same packet
+        """
+        plc = self.PLC
+        ack = self._ack_request
+        self._ack_request = None
+        if ack is not None and plc.Micro800:
+            # no multiple service packets
+            status, ret_data = plc.conn.send(ack)
+            self._set_ack(status)
+            ack = None
+
+        if ack is None:
+            status, ret_data = plc.conn.send(self._trigger_request)
+            if not ret_data:
+                return Response(self.Trigger, None, status)
+            segment = ret_data[46:]
+        else:
+            status, ret_data = plc.conn.send(plc._build_multi_service([ack, self._trigger_request]))
+            if not ret_data:
+                self._set_ack(status)
+                return Response(self.Trigger, None, status)
+            segments = plc._split_multi_service_reply(ret_data)
+            self._set_ack(unpack_from('<B', segments[0], 2)[0])
+            segment = segments[1]
+
+        tag_name, value, status = plc._parse_read_segment(segment, [self.Trigger, 1, None])
+        return Response(tag_name, value, status)
+
+    def _read_payload(self):
+        """
+        Send the payload requests pipelined, the payload is read
+        on its own when the replies aren't fragmented like before
+        """
+        plc = self.PLC
+        if self._payload_requests is None:
+            return self._learn_payload()
+
+        replies = plc._send_requests(self._payload_requests)
+        last = len(replies) - 1
+        for i, (status, ret_data) in enumerate(replies):
+            if status != (0 if i == last else 6) or len(ret_data) != self._payload_sizes[i]:
+                self._payload_requests = None
+                return self._learn_payload()
+
+        pad = self._pad()
+        data = b''.join(ret_data[50 if i == 0 else 50 + pad:] for i, (_, ret_data) in enumerate(replies))
+        return self._decode(data, 0)
+
+    def _learn_payload(self):
+        """
+        Read the payload fragment by fragment, like Read,
+        and keep the requests to send them all at once next time
+        """
+        plc = self.PLC
+        tag, base_tag, index = parse_tag_name(self.Payload)
+        data_type = plc.KnownTags[base_tag][0]
+        ioi = plc._build_ioi(self.Payload, data_type)
+        elements = self.Count
+        if data_type == 0xd3 or bit_of_word(tag):
+            bits = plc.CIPTypes[data_type][0] * 8
+            start = int(tag.split('.')[-1]) if bit_of_word(tag) else index
+            elements = get_word_count(start, self.Count, bits)
+        pad = self._pad()
+
+        requests = [plc._add_read_service(ioi, elements)]
+        sizes = []
+        status, ret_data = plc.conn.send(requests[0])
+        if not ret_data:
+            return Response(self.Payload, None, status)
+        sizes.append(len(ret_data))
+        data = ret_data[50:]
+        plc.Offset = len(data) - pad
+        while status == 6:
+            requests.append(plc._add_partial_read_service(ioi, elements))
+            status, ret_data = plc.conn.send(requests[-1])
+            if not ret_data:
+                return Response(self.Payload, None, status)
+            sizes.append(len(ret_data))
+            data += ret_data[50 + pad:]
+            plc.Offset += len(ret_data) - 50 - pad
+
+        if status == 0:
+            self._payload_requests = requests
+            self._payload_sizes = sizes
+        return self._decode(data, status)
+
+    def _decode(self, data, status):
+
+        if status != 0:
+            return Response(self.Payload, None, status)
+
+        values = self.PLC._parse_reply(self.Payload, self.Count, data)
+        if not values:
+            value = None
+        elif len(values) == 1:
+            value = values[0]
+        else:
+            value = values
+        return Response(self.Payload, value, status)
+
+    def _pad(self):
+        """
+        Bytes before the data in each reply, the
+        data type and the handle of structures
+        """
+        tag, base_tag, index = parse_tag_name(self.Payload)
+        return 4 if self.PLC.KnownTags[base_tag][0] == 0xa0 else 2
+
+    def _set_ack(self, status):
+
+        self.AckResponse = Response(self.Ack, None, status)
@@ -0,0 +1,253 @@
+"""
+   Copyright 2022 Dustin Roeder (dmroeder@gmail.com)
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from .lgx_response import Response
+
+try:
+    import threading
+except ImportError:
+    # micropython
+    threading = None
+
+
+class PendingWrite(object):
+    """
+    A write waiting in a WriteBuffer.  Response is None until the
+    write has been sent, writes replaced by a newer value for the
+    same tag get the Response of the write that replaced them.
+    """
+    __slots__ = ('TagName', 'Value', 'Response', '_callback', '_event')
+
+    def __init__(self, tag_name, value, callback=None):
+
+        self.TagName = tag_name
+        self.Value = value
+        self.Response = None
+        self._callback = callback
+        self._event = threading.Event() if threading else None
+
+    def __repr__(self):
+
+        return 'PendingWrite(TagName={}, Value={}, Response={})'.format(self.TagName, self.Value, self.Response)
+
+    def Done(self):
+        """
+        True once the write has been sent
+        """
+        return self.Response is not None
+
+    def Wait(self, timeout=None):
+        """
+        Wait for the write to be sent, returns the Response,
+        or None if the timeout expired first
+        """
+        if self._event is not None:
+            self._event.wait(timeout)
+        return self.Response
+
+    def _set_response(self, response):
+
+        self.Response = response
+        if self._event is not None:
+            self._event.set()
+        if self._callback:
+            _call(self._callback, response)
+
+
+class WriteBuffer(object):
+    """
+    Collects writes for a PLC and sends them in the background, rather
+    than writing each one as it's made.  Writing a tag that is already
+    waiting replaces its value (last value wins), so a tag written many
+    times between flushes is only written once.
+
+    The buffer is flushed every interval (seconds), or as soon as
+    max_size tags are waiting.  Flushes use the batch Write, so the tags
+    are packed into as few packets as possible.
+
+    callback, when provided, is called with the Response of every write.
+
+    The PLC instance shouldn't be used by other threads while the buffer
+    is running.  Without threading (micropython), writes are only sent
+    when max_size is reached or Flush is called.
+    """
+
+    def __init__(self, plc, interval=0.1, max_size=100, callback=None):
+
+        self.PLC = plc
+        self.Interval = interval
+        self.MaxSize = max_size
+        self.Callback = callback
+
+        self._pending = {}
+        self._order = []
+        self._lock = threading.Lock() if threading else None
+        self._flush_lock = threading.Lock() if threading else None
+        self._wake = threading.Event() if threading else None
+        self._running = False
+        self._thread = None
+        self.Start()
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.Close()
+
+    def __len__(self):
+
+        return len(self._order)
+
+    def Write(self, tag, value, datatype=None, callback=None):
+        """
+        Add a write to the buffer, returns a PendingWrite
+        that holds the Response once it has been sent.
+        Optional callback is called with the Response
+        """
+        pending = PendingWrite(tag, value, callback)
+        key = tag.lower()
+
+        self._acquire(self._lock)
+        try:
+            if key in self._pending:
+                # replaced writes wait for the new value to be written
+                writes = self._pending[key][2]
+            else:
+                writes = []
+                self._order.append(key)
+            writes.append(pending)
+            self._pending[key] = (tag, (value, datatype), writes)
+            full = len(self._order) >= self.MaxSize
+        finally:
+            self._release(self._lock)
+
+        if full:
+            if self._running:
+                self._wake.set()
+            else:
+                self.Flush()
+
+        return pending
+
+    def Flush(self):
+        """
+        Send the writes waiting in the buffer now,
+        returns the list of Response
+        """
+        self._acquire(self._flush_lock)
+        try:
+            self._acquire(self._lock)
+            try:
+                pending = [self._pending[key] for key in self._order]
+                self._pending = {}
+                self._order = []
+            finally:
+                self._release(self._lock)
+
+            if not pending:
+                return []
+
+            tags = []
+            for tag, (value, datatype), _ in pending:
+                if datatype is None:
+                    tags.append((tag, value))
+                else:
+                    tags.append((tag, value, datatype))
+
+            responses = self._write(tags)
+            for (_, _, writes), response in zip(pending, responses):
+                for write in writes:
+                    write._set_response(response)
+                if self.Callback:
+                    _call(self.Callback, response)
+
+            return responses
+        finally:
+            self._release(self._flush_lock)
+
+    def _write(self, tags):
+        """
+        Batch write the tags, one at a time where multiple
+        service packets aren't supported (Micro800)
+        """
+        try:
+            if not self.PLC.Micro800:
+                responses = self.PLC.Write(tags, coalesce=True)
+                if isinstance(responses, list):
+                    return responses
+                if responses.Status != 'Service not supported':
+                    return [Response(t[0], t[1], responses.Status) for t in tags]
+            return [self.PLC.Write(*t) for t in tags]
+        except Exception as e:
+            return [Response(t[0], t[1], str(e)) for t in tags]
+
+    def Start(self):
+        """
+        Start flushing in the background, called when the
+        buffer is created.  Does nothing without threading
+        """
+        if threading is None or self._running:
+            return
+
+        self._running = True
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def Close(self):
+        """
+        Stop the background flushing and send
+        the writes that are still waiting
+        """
+        if self._running:
+            self._running = False
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.Flush()
+
+    def _run(self):
+        """
+        Flush every interval, or when woken up by a full buffer
+        """
+        while self._running:
+            self._wake.wait(self.Interval)
+            self._wake.clear()
+            self.Flush()
+
+    def _acquire(self, lock):
+
+        if lock is not None:
+            lock.acquire()
+
+    def _release(self, lock):
+
+        if lock is not None:
+            lock.release()
+
+
+def _call(callback, response):
+    """
+    Call a user callback, an error in it shouldn't stop
+    the other writes from getting their Response
+    """
+    try:
+        callback(response)
+    except Exception as e:
+        print('WriteBuffer callback failed', e)
@@ -15,6 +15,7 @@
 """
 
 import sys
+import time
 
 
 def is_micropython():
@@ -39,3 +40,13 @@ def is_python2():
             return True
         return False
     return False
+
+
+def monotonic():
+    """
+    Seconds from a clock that isn't changed by setting the system
+    time, python 2 and micropython fall back to time.time
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic()
+    return time.time()
@@ -22,8 +22,17 @@ import pylogix
 import time
 import unittest
 
+from array import array
+from pylogix.lgx_history import TagHistory
+from pylogix.lgx_index import TagIndex
+from pylogix.lgx_logger import BinaryLogger, CSVLogger, read_binary_log
+from pylogix.lgx_plan import ReadPlan
 from pylogix.lgx_response import Response
+from pylogix.lgx_ring_follower import RingFollower
+from pylogix.lgx_sql import SQLSink
 from pylogix.lgx_tag import Tag  # Need Classes for type checking
+from pylogix.lgx_trigger import TriggerCapture
+from pylogix.lgx_write_buffer import WriteBuffer
 from Randomizer import Randomizer
 from pylogix.utils import is_micropython, is_python2
 
@@ -467,6 +476,16 @@ class PylogixTests(unittest.TestCase):
     def test_multi_write(self):
         self.multi_write_fixture()
 
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_multi_write_bits(self):
+        self.comm.Write('BaseDINT', 0)
+        tags = [('BaseDINT.0', True), ('BaseDINT.5', True), ('BaseDINT.9', True), ('BaseDINT.5', False),
+                ('BaseBOOLArray[1]', True), ('BaseBOOLArray[2]', False)]
+        responses = self.comm.Write(tags)
+        self.assertEqual([r.Status for r in responses], ['Success'] * len(tags), "Bit writes failed")
+        self.assertEqual(self.comm.Read('BaseDINT').Value, 0x201, "Merged bit writes do not match")
+        self.assertEqual(self.comm.Read('BaseBOOLArray[1]', 2).Value, [True, False], "Merged bool writes do not match")
+
     @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
     def test_bool_list(self):
         tags = self.bool_list_fixture(128)
@@ -479,6 +498,240 @@ class PylogixTests(unittest.TestCase):
     def test_array_write(self):
         self.write_array_fixture()
 
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_buffer_write(self):
+        values = array('i', [self.r.Dint() for _ in range(10)])
+        response = self.comm.Write('BaseDINTArray[0]', values)
+        self.assertEqual(response.Status, 'Success', response.Status)
+        self.assertEqual(self.comm.Read('BaseDINTArray[0]', 10).Value, list(values),
+                         "Buffer write values do not match")
+
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_string_array_write(self):
+        values = [self.r.String() for _ in range(32)]
+        response = self.comm.Write('BaseSTRINGArray[0]', values)
+        self.assertEqual(response.Status, 'Success', response.Status)
+        self.assertEqual(self.comm.Read('BaseSTRINGArray[0]', 32).Value, values,
+                         "String array values do not match")
+
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_struct_write(self):
+        sint = self.r.Sint()
+        dint = self.r.Dint()
+        string = self.r.String()
+        self.comm.GetTagList()
+        self.comm.Write('UDTBasic.b_INT', 5)
+        response = self.comm.Write('UDTBasic', {'b_SINT': sint, 'b_DINT': dint, 'b_STRING': string, 'b_BOOL': True})
+        self.assertEqual(response.Status, 'Success', response.Status)
+        self.assertEqual(self.comm.Read('UDTBasic.b_SINT').Value, sint, "Struct write SINT does not match")
+        self.assertEqual(self.comm.Read('UDTBasic.b_DINT').Value, dint, "Struct write DINT does not match")
+        self.assertEqual(self.comm.Read('UDTBasic.b_STRING').Value, string, "Struct write STRING does not match")
+        self.assertEqual(self.comm.Read('UDTBasic.b_BOOL').Value, True, "Struct write BOOL does not match")
+        self.assertEqual(self.comm.Read('UDTBasic.b_INT').Value, 5, "Struct write changed a member not written")
+
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_struct_write_cached_templates(self):
+        # a second instance uses the templates the first one retrieved
+        self.comm.GetTagList()
+        preset = abs(self.r.Int())
+        string = self.r.String()
+        with pylogix.PLC(plcConfig.plc_ip, plcConfig.plc_slot) as comm:
+            response = comm.Write('UDTBasic', {'b_STRING': string, 'b_Timer': {'PRE': preset}})
+            self.assertEqual(response.Status, 'Success', response.Status)
+            self.assertEqual(comm.UDT, {}, "Tag list should not have been retrieved")
+        self.assertEqual(self.comm.Read('UDTBasic.b_STRING').Value, string, "Nested STRING does not match")
+        self.assertEqual(self.comm.Read('UDTBasic.b_Timer.PRE').Value, preset, "Nested UDT does not match")
+
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_read_changes(self):
+        value = self.r.Dint()
+        self.comm.Write('BaseDINT', value)
+        plan = ReadPlan(self.comm, ['BaseDINT', 'BaseINT', ('BaseDINTArray[0]', 2)])
+        self.assertEqual(len(plan.ReadChanges()), 3, "First read should return every tag")
+        self.assertEqual(plan.ReadChanges(), [], "Tags did not change")
+        self.comm.Write('BaseDINT', value + 1)
+        changes = plan.ReadChanges()
+        self.assertEqual([(r.TagName, r.Value) for r in changes], [('BaseDINT', value + 1)],
+                         "Changed tags do not match")
+
+    @unittest.skipIf(is_micropython(), 'No threading in micropython')
+    def test_subscribe(self):
+        value = self.r.Dint()
+        self.comm.Write('BaseDINT', value)
+        received = []
+        with pylogix.PLC(plcConfig.plc_ip, plcConfig.plc_slot) as comm:
+            # the subscription has the connection to itself
+            subscription = comm.Subscribe(['BaseDINT', 'BaseINT'], 50, received.append)
+            time.sleep(0.5)
+            self.comm.Write('BaseDINT', value + 1)
+            time.sleep(0.5)
+            subscription.Cancel()
+        values = [r.Value for r in received if r.TagName == 'BaseDINT']
+        self.assertEqual(values, [value, value + 1], "Subscription changes do not match")
+
+    @unittest.skipIf(is_micropython(), 'No threading in micropython')
+    def test_sample(self):
+        samples = []
+        with pylogix.PLC(plcConfig.plc_ip, plcConfig.plc_slot) as comm:
+            sampler = comm.Sample(['BaseDINT', 'BaseINT'], 100, lambda t, r: samples.append((t, r)))
+            time.sleep(1.05)
+            stats = sampler.Scheduler.Stats()[100]
+        self.assertTrue(9 <= len(samples) <= 11, "Sample count {} is off".format(len(samples)))
+        for timestamp, responses in samples:
+            self.assertAlmostEqual(timestamp * 10, round(timestamp * 10), 3, "Sample is not on the tick")
+            self.assertEqual([r.Status for r in responses], ['Success', 'Success'], "Sample failed")
+        self.assertEqual(stats.Samples, len(samples), "Sample stats do not match")
+
+    @unittest.skipIf(is_micropython(), 'No threading in micropython')
+    def test_stream(self):
+        timestamps = []
+        with pylogix.PLC(plcConfig.plc_ip, plcConfig.plc_slot) as comm:
+            with comm.Stream(['BaseDINT', 'BaseINT'], 0.1, max_size=2) as stream:
+                for timestamp, responses in stream:
+                    self.assertEqual([r.TagName for r in responses], ['BaseDINT', 'BaseINT'])
+                    timestamps.append(timestamp)
+                    if len(timestamps) == 2:
+                        # fall behind, the oldest samples are dropped
+                        time.sleep(0.55)
+                    if len(timestamps) == 4:
+                        break
+        self.assertGreater(stream.Dropped, 0, "Stream did not drop samples")
+        self.assertGreater(timestamps[2] - timestamps[1], 0.15, "Stream did not drop the oldest samples")
+
+    @unittest.skipIf(is_micropython(), 'No threading in micropython')
+    def test_trigger_capture(self):
+        value = self.r.Dint()
+        values = [self.r.Dint() for _ in range(10)]
+        self.comm.Write('BaseDINT', value)
+        self.comm.Write('BaseDINTArray[0]', values)
+        captured = []
+        with pylogix.PLC(plcConfig.plc_ip, plcConfig.plc_slot) as comm:
+            # the capture has the connection to itself
+            with TriggerCapture(comm, 'BaseDINT', 'BaseDINTArray[0]', lambda t, p: captured.append(p),
+                                count=10, ack='BaseINT', ack_value=1) as capture:
+                self.comm.Write('BaseINT', 0)
+                time.sleep(0.2)
+                self.comm.Write('BaseDINT', value + 1)
+                time.sleep(0.5)
+        self.assertEqual(len(captured), 1, "Trigger was not captured")
+        self.assertEqual(captured[0].Value, values, "Captured payload does not match")
+        self.assertEqual(self.comm.Read('BaseINT').Value, 1, "Ack was not written")
+        self.assertGreater(capture.Latency, 0.0, "Latency was not recorded")
+
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_read_chunks(self):
+        values = [self.r.Dint() for _ in range(10)]
+        self.comm.Write('BaseDINTArray[0]', values)
+        chunks = list(self.comm.ReadChunks('BaseDINTArray[0]', 10, chunk=4))
+        self.assertEqual([c.TagName for c in chunks], ['BaseDINTArray[0]', 'BaseDINTArray[4]', 'BaseDINTArray[8]'],
+                         "Chunk names do not match")
+        self.assertEqual([v for c in chunks for v in c.Value], values, "Chunk values do not match")
+
+        buffer = array('i', [0] * 10)
+        response = self.comm.ReadInto('BaseDINTArray[0]', buffer)
+        self.assertEqual(response.Value, 10, "ReadInto element count does not match")
+        self.assertEqual(list(buffer), values, "ReadInto values do not match")
+
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_read_chunks_multi_dim(self):
+        chunks = list(self.comm.ReadChunks('MultiDim[0,0,0]', 0x10000))
+        self.assertEqual(len(chunks), 1, "Multi-dimensional read should fail at once")
+        self.assertEqual(chunks[0].Status, 'Multi-dimensional arrays are limited to 65535 elements', chunks[0].Status)
+        response = self.comm.ReadInto('MultiDim[0,0,0]', array('i', [0] * 0x10000))
+        self.assertEqual(response.Status, 'Multi-dimensional arrays are limited to 65535 elements', response.Status)
+
+        buffer = array('i', [0] * 125)
+        response = self.comm.ReadInto('MultiDim[0,0,0]', buffer)
+        self.assertEqual(response.Value, 125, "Multi-dimensional element count does not match")
+
+    def test_ring_follower(self):
+        values = [self.r.Dint() for _ in range(10)]
+        self.comm.Write('BaseDINTArray[0]', values)
+        self.comm.Write('BaseINT', 7)
+        follower = RingFollower(self.comm, 'BaseDINTArray', 'BaseINT', 10)
+        self.assertEqual(follower.Read().Value, [], "First read should only find the head")
+        self.comm.Write('BaseINT', 9)
+        self.assertEqual(follower.Read().Value, values[7:9], "New elements do not match")
+        # wrap around
+        self.comm.Write('BaseINT', 3)
+        self.assertEqual(follower.Read().Value, values[9:] + values[:3], "Wrapped elements do not match")
+        self.assertEqual(follower.Read().Value, [], "No elements are new")
+
+    def test_tag_history(self):
+        value = self.r.Dint()
+        history = TagHistory(self.comm, 3)
+        for i in range(4):
+            self.comm.Write('BaseDINT', value + i)
+            history.Add(self.comm.Read(['BaseDINT', 'BaseINT']), 100.0 + i)
+        times, values = history.Query('BaseDINT')
+        self.assertEqual(list(times), [101.0, 102.0, 103.0], "History timestamps do not match")
+        self.assertEqual(list(values), [value + 1, value + 2, value + 3], "History values do not match")
+        self.assertEqual(list(history.Query('BaseDINT', 102.0)[1]), [value + 2, value + 3],
+                         "History range does not match")
+        times, values = history.Downsample('BaseDINT', 2.0, method='max')
+        self.assertEqual(values, [value + 1, value + 3], "Downsampled values do not match")
+
+        history = TagHistory(self.comm, 3)
+        for i in range(2):
+            self.comm.Write('BaseBits.3', bool(i))
+            history.Add(self.comm.Read('BaseBits.3'), 100.0 + i)
+        self.assertEqual(history.Query('BaseBits.3')[1], [False, True], "History bits should be bools")
+
+    @unittest.skipIf(is_micropython(), 'No tempfile in micropython')
+    def test_logger(self):
+        import os
+        import tempfile
+        value = self.r.Dint()
+        self.comm.Write('BaseDINT', value)
+        plan = ReadPlan(self.comm, ['BaseDINT', 'BaseINT'])
+        directory = tempfile.mkdtemp()
+
+        path = os.path.join(directory, 'log.csv')
+        with CSVLogger(path, buffer_size=2) as log:
+            for _ in range(3):
+                log.LogRead(plan)
+        with open(path) as f:
+            rows = f.read().splitlines()
+        self.assertEqual(rows[0], 'Timestamp,BaseDINT,BaseINT', "CSV header does not match")
+        self.assertEqual(len(rows), 4, "CSV rows were not written")
+        self.assertEqual(rows[1].split(',')[1], str(value), "CSV value does not match")
+
+        path = os.path.join(directory, 'log.bin')
+        with BinaryLogger(path, self.comm, fsync_interval=0.0) as log:
+            for _ in range(3):
+                log.LogRead(plan)
+        names, records = read_binary_log(path)
+        self.assertEqual(names, ['BaseDINT', 'BaseINT'], "Binary log names do not match")
+        self.assertEqual([r[1][0] for r in records], [value] * 3, "Binary log values do not match")
+
+    @unittest.skipIf(is_micropython(), 'No sqlite3 in micropython')
+    def test_sql_sink(self):
+        import sqlite3
+        value = self.r.Dint()
+        self.comm.Write('BaseDINT', value)
+        db = sqlite3.connect(':memory:')
+        sink = SQLSink(db, max_rows=4)
+        sink.Add(self.comm.Read(['BaseDINT', 'BaseINT']))
+        self.assertFalse(sink.Flush(), "Insert should fail without the table")
+        self.assertEqual(len(sink), 2, "Rows were not kept to retry")
+
+        db.execute('CREATE TABLE tag_values (Timestamp REAL, TagName TEXT, Value, Status TEXT)')
+        with sink:
+            sink.Add(self.comm.Read('BaseDINT'))
+        rows = db.execute('SELECT TagName, Value FROM tag_values').fetchall()
+        self.assertEqual(len(rows), 3, "Rows were not inserted")
+        self.assertEqual(rows[-1], ('BaseDINT', value), "Inserted value does not match")
+
+    @unittest.skipIf(plcConfig.isMicro800, 'for Micro800')
+    def test_write_buffer(self):
+        value = self.r.Dint()
+        with WriteBuffer(self.comm, interval=0.05) as buffer:
+            first = buffer.Write('BaseDINT', value - 1)
+            last = buffer.Write('BaseDINT', value)
+            self.assertEqual(last.Wait(5.0).Status, 'Success', "WriteBuffer write failed")
+        self.assertIs(first.Response, last.Response, "WriteBuffer did not coalesce the writes")
+        self.assertEqual(self.comm.Read('BaseDINT').Value, value, "WriteBuffer value does not match")
+
     def test_message(self):
         self.message_fixture()
 
@@ -506,6 +759,50 @@ class PylogixTests(unittest.TestCase):
         tags = self.comm.GetTagList()
         self.assertEqual(tags.Status, 'Success', tags.Status)
 
+    def test_refresh_tag_list(self):
+        tags = self.comm.RefreshTagList()
+        self.assertEqual(tags.Status, 'Success', tags.Status)
+        refreshed = self.comm.RefreshTagList()
+        self.assertEqual(
+            [t.TagName for t in tags.Value], [t.TagName for t in refreshed.Value],
+            "RefreshTagList does not match the previous tag list")
+
+    def test_iter_tag_list(self):
+        tags = self.comm.GetTagList()
+        iter_tags = list(self.comm.IterTagList())
+        self.assertEqual(
+            [(t.TagName, t.DataType) for t in tags.Value],
+            [(t.TagName, t.DataType) for t in iter_tags],
+            "IterTagList does not match GetTagList")
+
+    def test_tag_table(self):
+        tags = self.comm.GetTagList()
+        table = self.comm.GetTagTable()
+        self.assertEqual(table.Status, 'Success', table.Status)
+        self.assertEqual(
+            [(t.TagName, t.DataType) for t in tags.Value],
+            [(t.TagName, t.DataType) for t in table.Value],
+            "GetTagTable does not match GetTagList")
+
+    def test_tag_index(self):
+        tags = self.comm.GetTagList()
+        index = TagIndex(tags.Value, self.comm.UDT)
+        for tag in tags.Value:
+            self.assertEqual(index.Find(tag.TagName.upper()), tag, "TagIndex could not find " + tag.TagName)
+        program_tags = index.StartsWith('Program:MainProgram.')
+        self.assertEqual(
+            sorted(t.TagName for t in index.ByProgram('Program:MainProgram')), sorted(program_tags),
+            "TagIndex program lookup does not match prefix lookup")
+        self.assertEqual(index.Find('UDTBasic.b_DINT').DataType, 'DINT', "TagIndex member lookup failed")
+
+    def test_expand_tags(self):
+        tags = self.comm.GetTagList()
+        leaves = self.comm.ExpandTags(tags.Value)
+        self.assertEqual(leaves.Status, 'Success', leaves.Status)
+        self.assertIn('UDTBasic.b_DINT', leaves.Value.TagNames, "ExpandTags did not expand UDTBasic")
+        for name, data_type, root, offset, bit, dims in leaves.Value:
+            self.assertTrue(name.startswith(root), "ExpandTags root does not match " + name)
+
     def test_unexistent_tags(self):
         expected_msg = (plcConfig.isMicro800
             and 'Path destination unknown'